@@ -0,0 +1,52 @@
+"""对比字符类别判断的开销
+
+    $ python -m benchmarks.char_classes
+"""
+import re
+import timeit
+
+from prettymd.formatter import CHAR_FLAGS, REQUIRE_SPACE, ZH, LineFormatter
+
+from .corpus import make_manual_lines
+
+
+def legacy_require_space(string):
+    """查表之前的实现，用作对照"""
+    return (re.match(r'[a-zA-Z0-9_\\\[\]\{\}\*\'&#\$\(\)]', string)
+            or string in ("'", '"', ':', ';', '(', ')', '/')
+            or string in ['-', '`', '=', '.', ','])
+
+
+def legacy_is_zh(string):
+    return string and ('一' <= string <= '龥' or string in '，。（）：、')
+
+
+def main(number=5):
+    lines = make_manual_lines()
+    chars = ''.join(lines)
+    size = len(chars) * number
+
+    def legacy():
+        for char in chars:
+            legacy_require_space(char)
+            legacy_is_zh(char)
+
+    def table():
+        for char in chars:
+            flags = CHAR_FLAGS.get(char, 0)
+            flags & REQUIRE_SPACE
+            flags & ZH
+
+    def line_formatter():
+        for line in lines:
+            LineFormatter(line, '`').format()
+
+    for name, fn in (('legacy predicates', legacy),
+                     ('table lookup', table),
+                     ('LineFormatter.format', line_formatter)):
+        cost = timeit.timeit(fn, number=number)
+        print('%-22s %8.1f ns/char' % (name, cost / size * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""小段文本的单次调用开销
+
+    $ python -m benchmarks.compiled
+"""
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from prettymd.formatter import CompiledFormatter, format
+
+SNIPPETS = [
+    '默认的表名是appName，在',
+    '## 标题title',
+    '使用`git reset --hard`或 [文档](https://example.com)',
+    '> 引用quote',
+]
+
+
+def main(number=20000):
+    formatter = CompiledFormatter(style='code')
+
+    def call_format():
+        for snippet in SNIPPETS:
+            format(snippet, style='code')
+
+    def call_compiled():
+        for snippet in SNIPPETS:
+            formatter.format(snippet)
+
+    for name, fn in (('format', call_format), ('CompiledFormatter', call_compiled)):
+        cost = timeit.timeit(fn, number=number)
+        print('%-22s %8.2f us/call' % (name, cost / number / len(SNIPPETS) * 1e6))
+
+    with ThreadPoolExecutor(4) as executor:
+        cost = timeit.timeit(lambda: list(executor.map(formatter.format, SNIPPETS * 100)), number=number // 100)
+    print('%-22s %8.2f us/call' % ('4 threads', cost / number / len(SNIPPETS) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
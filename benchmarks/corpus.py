@@ -0,0 +1,93 @@
+"""生成可重复的测试语料
+
+每个函数接收 random.Random 和规模 size（大致的行数），返回 markdown 文本。
+"""
+import random
+
+EN_WORDS = ['config', 'request.get()', 'HTTP', 'user_id', '--verbose', 'v1.2', 'QuerySet', 'f(x)', 'a/b']
+ZH_MARKS = '，。、：'
+
+
+def zh_text(rand, low=2, high=8):
+    return ''.join(chr(rand.randint(0x4e00, 0x9fa5)) for _ in range(rand.randint(low, high)))
+
+
+def make_manual_lines(count=2000, seed=0):
+    """生成类似中文手册的文本行"""
+    rand = random.Random(seed)
+    return [mixed_line(rand) for _ in range(count)]
+
+
+def mixed_line(rand, words=(5, 20)):
+    parts = []
+    for _ in range(rand.randint(*words)):
+        if rand.random() < 0.2:
+            parts.append(rand.choice(EN_WORDS))
+        else:
+            parts.append(zh_text(rand))
+        parts.append(rand.choice(ZH_MARKS) if rand.random() < 0.2 else '')
+    return ''.join(parts)
+
+
+def pure_cjk(rand, size):
+    return '\n'.join(zh_text(rand, 20, 80) + '。' for _ in range(size))
+
+
+def mixed_prose(rand, size):
+    return '\n'.join(mixed_line(rand) for _ in range(size))
+
+
+def link_list(rand, size):
+    return '\n'.join(
+        '%s. [%s %s](https://example.com/%s?id=%s) 参见%s' % (
+            index + 1, zh_text(rand), rand.choice(EN_WORDS), rand.choice(EN_WORDS), index, zh_text(rand))
+        for index in range(size)
+    )
+
+
+def large_table(rand, size):
+    lines = ['名称 | 类型 | 说明', '-----|------|-----']
+    lines.extend('%s | %s | %s' % (rand.choice(EN_WORDS), zh_text(rand), mixed_line(rand, (1, 4)))
+                 for _ in range(size))
+    return '\n'.join(lines)
+
+
+def code_fences(rand, size):
+    lines = []
+    while len(lines) < size:
+        lines.append(mixed_line(rand, (2, 6)))
+        lines.append('```python')
+        for index in range(50):
+            lines.append('In [%s]: value = compute(%s)  # 计算' % (index, index))
+            lines.append('Out[%s]: %s' % (index, index * 2))
+        lines.append('```')
+    return '\n'.join(lines)
+
+
+def header_tree(rand, size):
+    lines = []
+    level = 2
+    for _ in range(size // 2):
+        level = max(1, min(6, level + rand.choice((-1, 0, 1))))
+        lines.append('#' * level + ' ' + mixed_line(rand, (1, 3)))
+        lines.append(mixed_line(rand))
+    return '\n'.join(lines)
+
+
+def long_lines(rand, size):
+    return '\n'.join(''.join(mixed_line(rand) for _ in range(200)) for _ in range(max(1, size // 100)))
+
+
+CORPORA = {
+    'pure_cjk': pure_cjk,
+    'mixed_prose': mixed_prose,
+    'link_list': link_list,
+    'large_table': large_table,
+    'code_fences': code_fences,
+    'header_tree': header_tree,
+    'long_lines': long_lines,
+}
+
+
+def make_corpus(name, size=2000, seed=0):
+    return CORPORA[name](random.Random(seed), size)
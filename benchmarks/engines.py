@@ -0,0 +1,25 @@
+"""对比不同格式化引擎的速度
+
+    $ python -m benchmarks.engines
+"""
+import timeit
+
+from prettymd.formatter import Formatter
+
+from .corpus import make_manual_lines
+
+
+def main(number=3):
+    text = '\n'.join(make_manual_lines())
+    size = len(text.encode('utf-8')) * number / 1024 / 1024
+
+    # 没有安装 numpy 时 numpy 引擎与 run 相同
+    for engine in ('char', 'run', 'numpy'):
+        # 第一次使用 numpy 引擎时导入 numpy 并建表，不计入耗时
+        Formatter(text, style='code', engine=engine).format()
+        cost = timeit.timeit(lambda: Formatter(text, style='code', engine=engine).format(), number=number)
+        print('%-6s %8.2f MB/s' % (engine, size / cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""通过 tracemalloc 测量格式化过程的内存占用
+
+    $ python -m benchmarks.memory
+    $ python -m benchmarks.memory mixed_prose --size 5000
+
+按每 MB 输入列出格式化过程中的内存峰值和创建的行格式化引擎数量。
+"""
+import tracemalloc
+from argparse import ArgumentParser
+
+from prettymd.formatter import LINE_CACHE, Formatter
+
+from .corpus import CORPORA, make_corpus
+
+
+def counting_engine(engine_class):
+    """返回记录创建次数的行格式化引擎"""
+
+    class CountingEngine(engine_class):
+        __slots__ = ()
+        created = 0
+
+        def __init__(self, *args, **kwargs):
+            CountingEngine.created += 1
+            super().__init__(*args, **kwargs)
+
+    return CountingEngine
+
+
+def measure(text, engine='char', line_cache=False):
+    formatter = Formatter(text, style='code', engine=engine, line_cache=line_cache)
+    formatter.line_formatter_class = counting_engine(formatter.line_formatter_class)
+    LINE_CACHE.clear()
+
+    tracemalloc.start()
+    try:
+        formatter.format()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    size = len(text.encode('utf-8')) / 1024 / 1024
+    return {
+        'peak_kb_per_mb': peak / 1024 / size,
+        'engines_per_mb': formatter.line_formatter_class.created / size,
+    }
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('corpora', metavar='CORPUS', nargs='*')
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--line-cache', dest='line_cache', action='store_true', default=False)
+    args = parser.parse_args()
+
+    for name in args.corpora:
+        if name not in CORPORA:
+            parser.error('unknown corpus %s, choose from %s' % (name, ', '.join(CORPORA)))
+
+    print('%-12s %-6s %14s %12s' % ('corpus', 'engine', 'peak KB/MB', 'engines/MB'))
+
+    for name in args.corpora or list(CORPORA):
+        text = make_corpus(name, args.size)
+        for engine in ('char', 'run'):
+            result = measure(text, engine=engine, line_cache=args.line_cache)
+            print('%-12s %-6s %14.0f %12.0f' % (
+                name, engine, result['peak_kb_per_mb'], result['engines_per_mb']))
+
+
+if __name__ == '__main__':
+    main()
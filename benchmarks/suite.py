@@ -0,0 +1,149 @@
+"""在各类语料上分别测量 format、Formatter.format、LineFormatter.format 和 HeaderFormatter.set
+
+    $ python -m benchmarks.suite
+    $ python -m benchmarks.suite --save baseline
+    $ python -m benchmarks.suite --compare baseline
+
+结果保存在 benchmarks/baselines/<name>.json，比较时列出吞吐量相对基线的变化。
+"""
+import json
+import os
+import platform
+import time
+from argparse import ArgumentParser
+
+from prettymd.formatter import Formatter, HeaderFormatter, format
+
+from .corpus import CORPORA, make_corpus
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+
+class RecordingFormatter(Formatter):
+    """记录交给行格式化引擎处理的行"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prose_lines = []
+
+    def format_lines(self, lines):
+        self.prose_lines.extend(lines)
+        return super().format_lines(lines)
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        cost = time.perf_counter() - start
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+def measure(text, engine='char', repeat=3):
+    """返回每个阶段的耗时、处理的字节数和行数"""
+    options = dict(style='code', engine=engine)
+    recorder = RecordingFormatter(text, reindex_headers=False, **options)
+    recorder.format()
+    line_formatter_class = recorder.line_formatter_class
+    prose_lines = recorder.prose_lines
+    new_lines = recorder.new_lines
+    headers = recorder.header_formatter.headers
+
+    def run_header_formatter():
+        header_formatter = HeaderFormatter(list(new_lines))
+        header_formatter.headers = headers
+        header_formatter.set()
+
+    stages = {
+        'format': (lambda: format(text, **options), text, text.splitlines()),
+        'Formatter.format': (lambda: Formatter(text, reindex_headers=False, **options).format(),
+                             text, text.splitlines()),
+        'LineFormatter.format': (lambda: [line_formatter_class(line, '`').format() for line in prose_lines],
+                                 '\n'.join(prose_lines), prose_lines),
+        'HeaderFormatter.set': (run_header_formatter, '\n'.join(new_lines[index] for index in headers), headers),
+    }
+
+    results = {}
+    for stage, (fn, stage_text, stage_lines) in stages.items():
+        if not stage_lines:
+            continue
+
+        cost = best_of(fn, repeat)
+        size = len(stage_text.encode('utf-8'))
+        results[stage] = {
+            'seconds': cost,
+            'mb_per_second': size / 1024 / 1024 / cost if cost else 0,
+            'lines_per_second': len(stage_lines) / cost if cost else 0,
+        }
+    return results
+
+
+def run(corpora, size, engine, repeat):
+    results = {}
+    for name in corpora:
+        results[name] = measure(make_corpus(name, size), engine=engine, repeat=repeat)
+    return results
+
+
+def report(results, baseline=None):
+    print('%-12s %-22s %10s %12s %9s' % ('corpus', 'stage', 'MB/s', 'lines/s', 'change'))
+
+    for name, stages in results.items():
+        for stage, result in stages.items():
+            change = ''
+            try:
+                base = baseline['results'][name][stage]['mb_per_second']
+            except (TypeError, KeyError):
+                pass
+            else:
+                if base:
+                    change = '%+.1f%%' % ((result['mb_per_second'] / base - 1) * 100)
+
+            print('%-12s %-22s %10.2f %12.0f %9s' % (
+                name, stage, result['mb_per_second'], result['lines_per_second'], change))
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, name + '.json')
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('corpora', metavar='CORPUS', nargs='*')
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--engine', default='char')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    args = parser.parse_args()
+
+    for name in args.corpora:
+        if name not in CORPORA:
+            parser.error('unknown corpus %s, choose from %s' % (name, ', '.join(CORPORA)))
+
+    results = run(args.corpora or list(CORPORA), args.size, args.engine, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(baseline_path(args.compare), encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report(results, baseline)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        data = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'size': args.size,
+            'engine': args.engine,
+            'results': results,
+        }
+        with open(baseline_path(args.save), 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,4 +4,4 @@ __author__ = """kingron"""
 __email__ = 'kingronjan@qq.com'
 __version__ = '0.1.2'
 
-from .formatter import format, format_file
+from .formatter import CompiledFormatter, format, format_file, format_stream, is_formatted
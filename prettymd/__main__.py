@@ -1,7 +1,12 @@
+import os
 import sys
 
 from argparse import ArgumentParser
-from prettymd import format, format_file
+from prettymd import format, format_file, format_stream, is_formatted
+from prettymd.batch import check_paths, format_paths, is_pattern
+from prettymd.cache import ResultCache
+from prettymd.formatter import FormatStats
+from prettymd.git import changed_files
 
 
 def main():
@@ -13,16 +18,94 @@ def main():
     parser.add_argument('-p --py-prompt', dest='py_prompt', default='shell')
     parser.add_argument('-n --newline-between-headers', dest='newline_between_headers', action='store_true', default=False)
     parser.add_argument('-s --style', dest='style', default=None)
+    parser.add_argument('-e --engine', dest='engine', default='char')
+    parser.add_argument('-j --jobs', dest='jobs', type=int, default=1)
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true', default=False)
+    parser.add_argument('--line-cache', dest='line_cache', action='store_true', default=False)
+    parser.add_argument('--stats', dest='stats', action='store_true', default=False)
+    parser.add_argument('--check', dest='check', action='store_true', default=False)
+    parser.add_argument('--serve', dest='serve', action='store_true', default=False)
+    parser.add_argument('--socket', dest='socket', default=None)
+    parser.add_argument('--changed-since', dest='changed_since', metavar='REF', default=None)
+    parser.add_argument('--staged', dest='staged', action='store_true', default=False)
+    parser.add_argument('--watch', dest='watch', metavar='DIR', default=None)
 
     args = parser.parse_args(args=sys.argv[1:])
     kwargs = dict(output=args.output,
                   style=args.style,
                   reindex_headers=args.reindex_headers,
                   py_prompt=args.py_prompt,
-                  newline_between_headers=args.newline_between_headers)
+                  newline_between_headers=args.newline_between_headers,
+                  engine=args.engine,
+                  line_cache=args.line_cache,
+                  stats=FormatStats() if args.stats else None)
 
-    if args.file:
-        format_file(args.file, **kwargs)
+    if args.serve:
+        from prettymd.server import serve
+        # 服务总是启用行缓存，见 FormatService
+        kwargs.pop('line_cache')
+        serve(args.socket, **kwargs)
+        return
+
+    if args.watch:
+        from prettymd.watch import watch
+        kwargs.pop('output')
+        kwargs.pop('stats')
+        try:
+            watch(args.watch, **kwargs)
+        except ValueError as e:
+            parser.error(str(e))
+        return
+
+    cache = None if args.no_cache else ResultCache()
+
+    # 只处理 git 中发生变化的文件
+    git_files = None
+    if args.changed_since or args.staged:
+        try:
+            git_files = changed_files(args.changed_since, staged=args.staged)
+        except ValueError as e:
+            parser.error(str(e))
+
+    # -f - 或没有指定内容且标准输入不是终端时从标准输入读取
+    read_stdin = args.file == '-' or (git_files is None and not args.file and not args.args
+                                      and sys.stdin is not None and not sys.stdin.isatty())
+
+    if args.check:
+        kwargs.pop('output')
+        if read_stdin:
+            # 与格式化标准输入时的输出比较，输出的末尾有一个换行符
+            content = sys.stdin.read()
+            formatted = content.endswith('\n') and is_formatted(content[:-1], **kwargs)
+            unformatted = [] if formatted else ['<stdin>']
+            for name in unformatted:
+                print('would reformat %s' % name)
+        elif git_files is not None:
+            unformatted = check_paths(git_files, jobs=args.jobs, cache=cache, **kwargs)
+        elif args.file:
+            unformatted = check_paths([args.file], jobs=args.jobs, cache=cache, **kwargs)
+        elif args.args:
+            unformatted = [content for content in args.args if not is_formatted(content, **kwargs)]
+            for content in unformatted:
+                print('would reformat %r' % content)
+        else:
+            print('No content specified.')
+            sys.exit(1)
+
+        print_stats(kwargs['stats'])
+        sys.exit(1 if unformatted else 0)
+
+    if read_stdin:
+        format_stdin(**kwargs)
+    elif git_files is not None:
+        kwargs.pop('output')
+        format_paths(git_files, jobs=args.jobs, cache=cache, **kwargs)
+    elif args.file and (os.path.isdir(args.file) or is_pattern(args.file)):
+        kwargs.pop('output')
+        format_paths([args.file], jobs=args.jobs, cache=cache, **kwargs)
+    elif args.file:
+        if format_file(args.file, cache=cache, **kwargs) is False:
+            print('%s unchanged, not written' % args.output)
     elif args.args:
         for content in args.args:
             format(content, **kwargs)
@@ -30,6 +113,29 @@ def main():
         print('No content specified.')
         sys.exit(1)
 
+    print_stats(kwargs['stats'])
+
+
+def format_stdin(output='stream', **kwargs):
+    """逐行读取标准输入，格式化后的行一经生成就写入标准输出"""
+    if output != 'stream':
+        format(sys.stdin, output=output, **kwargs)
+        return
+
+    empty = True
+    for line in format_stream(sys.stdin, **kwargs):
+        sys.stdout.write(line + '\n')
+        empty = False
+
+    # 与 print 的输出保持一致
+    if empty:
+        sys.stdout.write('\n')
+
+
+def print_stats(stats):
+    if stats is not None:
+        print(stats.report(), file=sys.stderr)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,29 @@
+"""在 asyncio 中使用 prettymd，格式化和文件读写都在 executor 中执行，不会阻塞事件循环"""
+import asyncio
+from functools import partial
+
+from .formatter import format, format_file
+
+
+async def run_in_executor(func, executor=None, semaphore=None):
+    """在 executor 中执行 func，指定 semaphore 时用于限制同时执行的数量
+
+    executor 为 None 时使用事件循环默认的线程池，也可以传入 ProcessPoolExecutor。
+    """
+    loop = asyncio.get_event_loop()
+
+    if semaphore is None:
+        return await loop.run_in_executor(executor, func)
+
+    async with semaphore:
+        return await loop.run_in_executor(executor, func)
+
+
+async def aformat(content, executor=None, semaphore=None, **kwargs):
+    """format 的协程版本"""
+    return await run_in_executor(partial(format, content, **kwargs), executor, semaphore)
+
+
+async def aformat_file(filepath, executor=None, semaphore=None, **kwargs):
+    """format_file 的协程版本，文件的读写也在 executor 中进行"""
+    return await run_in_executor(partial(format_file, filepath, **kwargs), executor, semaphore)
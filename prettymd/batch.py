@@ -0,0 +1,265 @@
+"""批量格式化多个文件"""
+import glob
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from itertools import islice
+
+from .formatter import CompiledFormatter, FormatStats, format, is_formatted, split_final_newline, write_file
+
+MARKDOWN_SUFFIXES = ('.md', '.markdown')
+
+# format_many 中每个 worker 最多同时排队的分片数量
+PENDING_CHUNKS_PER_WORKER = 2
+
+# 进程池中每个进程按参数创建一次的格式化器
+WORKER_FORMATTER = None
+
+
+def is_pattern(path):
+    return glob.has_magic(path)
+
+
+def find_files(paths):
+    """查找目录、通配符或文件路径对应的所有 markdown 文件"""
+    files = []
+
+    for path in paths:
+        if is_pattern(path):
+            matches = sorted(glob.glob(path, recursive=True))
+        else:
+            matches = [path]
+
+        for match in matches:
+            if os.path.isdir(match):
+                files.extend(find_dir_files(match))
+            elif os.path.isfile(match):
+                files.append(match)
+
+    return list(dict.fromkeys(files))
+
+
+def find_dir_files(dirpath):
+    files = []
+    for root, dirs, names in os.walk(dirpath):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(MARKDOWN_SUFFIXES))
+    return files
+
+
+def format_path(filepath, cache=None, **kwargs):
+    """原地格式化文件，返回内容是否发生变化，文件末尾的换行符会被保留"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    kwargs['output'] = None
+    body, newline = split_final_newline(content)
+
+    if cache is None:
+        new_content = format(body, **kwargs) + newline
+    else:
+        new_content = cache.format(body, **kwargs) + newline
+
+    if new_content == content:
+        return False
+
+    return write_file(filepath, new_content)
+
+
+def check_path(filepath, cache=None, **kwargs):
+    """检查文件是否已经格式化，不会修改文件"""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    kwargs.pop('output', None)
+    body, _ = split_final_newline(content)
+
+    if cache is None:
+        return is_formatted(body, **kwargs)
+    return cache.is_formatted(body, **kwargs)
+
+
+def run_with_stats(func, filepath, **kwargs):
+    """处理一个文件，同时返回这个文件的统计信息，统计信息可以传回主进程合并"""
+    stats = FormatStats()
+    return func(filepath, stats=stats, **kwargs), stats
+
+
+def map_files(func, filepaths, jobs=1, cache=None, stats=None, **kwargs):
+    """对每个文件调用 func，jobs 大于 1 时使用多进程，为 0 时使用全部 CPU
+
+    按文件的顺序返回结果，传入 stats 时合并各个文件的统计信息。
+    """
+    filepaths = list(filepaths)
+
+    if stats is None:
+        worker = partial(func, cache=cache, **kwargs)
+    else:
+        worker = partial(run_with_stats, func, cache=cache, **kwargs)
+
+    if jobs == 1 or len(filepaths) < 2:
+        return collect_results(map(worker, filepaths), stats)
+
+    jobs = jobs or os.cpu_count()
+    chunksize = max(1, len(filepaths) // (jobs * 4))
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return collect_results(executor.map(worker, filepaths, chunksize=chunksize), stats)
+
+
+def collect_results(results, stats=None):
+    if stats is None:
+        return list(results)
+
+    collected = []
+    for result, file_stats in results:
+        stats.merge(file_stats)
+        collected.append(result)
+    return collected
+
+
+def format_files(filepaths, jobs=1, cache=None, stats=None, **kwargs):
+    """原地格式化多个文件，返回内容发生变化的文件列表"""
+    filepaths = list(filepaths)
+    results = map_files(format_path, filepaths, jobs=jobs, cache=cache, stats=stats, **kwargs)
+    return [path for path, changed in zip(filepaths, results) if changed]
+
+
+def check_files(filepaths, jobs=1, cache=None, stats=None, **kwargs):
+    """检查多个文件，返回尚未格式化的文件列表"""
+    filepaths = list(filepaths)
+    results = map_files(check_path, filepaths, jobs=jobs, cache=cache, stats=stats, **kwargs)
+    return [path for path, formatted in zip(filepaths, results) if not formatted]
+
+
+def format_paths(paths, jobs=1, cache=None, stats=None, **kwargs):
+    """格式化目录或通配符匹配的文件并输出统计信息"""
+    start = time.perf_counter()
+    filepaths = find_files(paths)
+    changed = format_files(filepaths, jobs=jobs, cache=cache, stats=stats, **kwargs)
+
+    if cache is not None:
+        cache.evict()
+
+    for path in changed:
+        print('formatted %s' % path)
+
+    print('%s of %s files changed, %s unchanged files not written in %.2fs' % (
+        len(changed), len(filepaths), len(filepaths) - len(changed), time.perf_counter() - start))
+    return changed
+
+
+def check_paths(paths, jobs=1, cache=None, stats=None, **kwargs):
+    """检查目录或通配符匹配的文件，输出尚未格式化的文件"""
+    start = time.perf_counter()
+    filepaths = find_files(paths)
+    unformatted = check_files(filepaths, jobs=jobs, cache=cache, stats=stats, **kwargs)
+
+    if cache is not None:
+        cache.evict()
+
+    for path in unformatted:
+        print('would reformat %s' % path)
+
+    print('%s of %s files would be reformatted in %.2fs' % (
+        len(unformatted), len(filepaths), time.perf_counter() - start))
+    return unformatted
+
+
+def format_many(contents, workers=1, chunksize=1, ordered=True, pool='process', **kwargs):
+    """格式化多个文本，返回按输入顺序生成结果的迭代器
+
+    contents 可以是任意可迭代对象，只会按需读取：同时提交给 workers 的分片不超过 workers 的两倍，
+    每个分片包含 chunksize 个文本。workers 为 0 时使用全部 CPU，为 1 时在当前进程中格式化；
+    pool 为 'process' 或 'thread'，每个进程只按参数创建一次 CompiledFormatter，线程之间共享同一个。
+    ordered 为 False 时按完成的顺序生成 (序号, 结果)。
+
+        >>> list(format_many(['中文abc', 'abc中文'], workers=2, style='code'))
+        ['中文 `abc`', '`abc` 中文']
+    """
+    if pool not in ('process', 'thread'):
+        raise ValueError('unknown pool')
+
+    # 在提交任务之前校验参数
+    formatter = CompiledFormatter(**kwargs)
+    workers = workers or os.cpu_count()
+    chunks = iter_chunks(contents, max(1, chunksize))
+
+    if workers == 1:
+        return iter_format_chunks(formatter, chunks, ordered)
+
+    if pool == 'process':
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(formatter.options,))
+        func = format_chunk
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        func = partial(format_chunk, formatter=formatter)
+
+    return iter_pool_results(executor, func, chunks, workers * PENDING_CHUNKS_PER_WORKER, ordered)
+
+
+def iter_chunks(contents, chunksize):
+    """生成 (第一个文本的序号, 文本列表)"""
+    contents = iter(contents)
+    start = 0
+
+    while True:
+        chunk = list(islice(contents, chunksize))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def init_worker(options):
+    global WORKER_FORMATTER
+    WORKER_FORMATTER = CompiledFormatter(**options)
+
+
+def format_chunk(chunk, formatter=None):
+    formatter = formatter or WORKER_FORMATTER
+    return [formatter.format(content) for content in chunk]
+
+
+def iter_format_chunks(formatter, chunks, ordered):
+    for start, chunk in chunks:
+        for index, result in enumerate(format_chunk(chunk, formatter), start):
+            yield result if ordered else (index, result)
+
+
+def iter_pool_results(executor, func, chunks, max_pending, ordered):
+    """提交分片直到排队的分片达到 max_pending，取出结果后再继续提交"""
+    pending = deque()
+
+    try:
+        for start, chunk in chunks:
+            pending.append((start, executor.submit(func, chunk)))
+
+            if len(pending) >= max_pending:
+                yield from pop_results(pending, ordered)
+
+        while pending:
+            yield from pop_results(pending, ordered)
+    finally:
+        # 提前停止迭代时取消尚未开始的分片
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown()
+
+
+def pop_results(pending, ordered):
+    """取出一个已完成的分片的结果，ordered 时等待最早提交的分片"""
+    if ordered:
+        _, future = pending.popleft()
+        yield from future.result()
+        return
+
+    done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+    for item in list(pending):
+        start, future = item
+        if future in done:
+            pending.remove(item)
+            for index, result in enumerate(future.result(), start):
+                yield index, result
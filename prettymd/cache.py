@@ -0,0 +1,165 @@
+"""以文件内容哈希为键的格式化结果缓存"""
+import hashlib
+import inspect
+import json
+import os
+import time
+from pathlib import Path
+
+from . import __version__
+from .formatter import Formatter, format, is_formatted, write_output
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+# 不影响格式化结果的参数
+IGNORED_OPTIONS = ('output', 'line_cache', 'stats')
+
+# 缓存文件的第一个字符，标记结果与原内容是否相同
+UNCHANGED = '='
+CHANGED = '>'
+
+
+def default_cache_dir():
+    if os.environ.get('PRETTYMD_CACHE_DIR'):
+        return os.environ['PRETTYMD_CACHE_DIR']
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'prettymd')
+
+
+def normalize_options(options):
+    """补全 Formatter 的默认参数，使省略默认值和显式传入默认值得到相同的键"""
+    parameters = inspect.signature(Formatter).parameters
+    normalized = {name: param.default for name, param in parameters.items()
+                  if param.default is not param.empty and name not in IGNORED_OPTIONS}
+    normalized.update((name, value) for name, value in options.items() if name not in IGNORED_OPTIONS)
+    return normalized
+
+
+class ResultCache(object):
+    """格式化结果缓存，每个结果保存为缓存目录下的一个文件
+
+    键由 prettymd 版本、格式化参数和内容的哈希组成；超过 max_age 秒未使用的结果会被淘汰，
+    缓存总大小超过 max_size 字节时从最久未使用的结果开始淘汰。
+    """
+
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE, max_age=DEFAULT_MAX_AGE):
+        if path is None:
+            path = default_cache_dir()
+
+        self.path = Path(path)
+        self.max_size = max_size
+        self.max_age = max_age
+
+    def key(self, content, options):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([__version__, normalize_options(options)], sort_keys=True).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def get(self, key, content):
+        """返回缓存的格式化结果，不存在时返回 None"""
+        path = self.path / key
+
+        try:
+            with path.open('r', encoding='utf-8', newline='') as f:
+                data = f.read()
+            # 以修改时间记录最近一次使用的时间
+            os.utime(path)
+        except OSError:
+            return None
+
+        if data[:1] == UNCHANGED:
+            return content
+
+        if data[:1] == CHANGED:
+            return data[1:]
+
+        return None
+
+    def set(self, key, content, result):
+        data = UNCHANGED if result == content else CHANGED + result
+        path = self.path / key
+        tmp_path = self.path / ('%s.%s.tmp' % (key, os.getpid()))
+
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with tmp_path.open('w', encoding='utf-8', newline='') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # 缓存写入失败不影响格式化
+            pass
+
+    def lookup(self, content, kwargs):
+        """返回键和缓存的结果，并记录命中次数"""
+        key = self.key(content, kwargs)
+        result = self.get(key, content)
+
+        stats = kwargs.get('stats')
+        if stats is not None:
+            stats.counters['result_cache_misses' if result is None else 'result_cache_hits'] += 1
+
+        return key, result
+
+    def format(self, content, **kwargs):
+        output = kwargs.pop('output', None)
+        key, result = self.lookup(content, kwargs)
+
+        if result is None:
+            result = format(content, output=None, **kwargs)
+            self.set(key, content, result)
+
+        return write_output(result, output)
+
+    def is_formatted(self, content, **kwargs):
+        """判断内容是否已经格式化，已缓存的内容直接根据缓存的结果判断"""
+        kwargs.pop('output', None)
+        key, result = self.lookup(content, kwargs)
+
+        if result is not None:
+            return result == content
+
+        formatted = is_formatted(content, **kwargs)
+        if formatted:
+            # 只有已经格式化的内容才知道格式化的结果
+            self.set(key, content, content)
+
+        return formatted
+
+    def evict(self):
+        """淘汰过期的结果，并将缓存总大小控制在 max_size 以内"""
+        now = time.time()
+        entries = []
+
+        try:
+            scanner = os.scandir(self.path)
+        except OSError:
+            return
+
+        with scanner:
+            for entry in scanner:
+                try:
+                    stat = entry.stat()
+                    if now - stat.st_mtime > self.max_age:
+                        os.unlink(entry.path)
+                        continue
+                except OSError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+
+            total -= size
@@ -0,0 +1,135 @@
+"""常驻进程的客户端，没有运行中的服务时在当前进程中格式化
+
+    $ python -m prettymd --serve &
+    $ python -m prettymd.client -s code docs/a.md docs/b.md
+    $ echo '中文abc' | python -m prettymd.client
+
+请求的格式见 prettymd.server。
+"""
+import json
+import os
+import socket
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+
+def default_socket_path():
+    if os.environ.get('PRETTYMD_SOCKET'):
+        return os.environ['PRETTYMD_SOCKET']
+
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'prettymd.sock')
+
+    # 临时目录为所有用户共享，以用户 id 区分
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(tempfile.gettempdir(), 'prettymd-%s.sock' % uid)
+
+
+class Client(object):
+    """通过 Unix socket 向常驻进程发送请求，同一个连接可以发送多个请求
+
+        >>> with Client() as client:
+        ...     client.format('中文abc', style='code')
+        '中文 `abc`'
+    """
+
+    def __init__(self, socket_path=None, timeout=60):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.request_id = 0
+
+    def connect(self):
+        """连接服务，返回是否连接成功"""
+        if not hasattr(socket, 'AF_UNIX'):
+            return False
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            return False
+
+        self.sock = sock
+        self.reader = sock.makefile('r', encoding='utf-8', newline='\n')
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = self.reader = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def call(self, payload):
+        self.request_id += 1
+        payload['id'] = self.request_id
+        self.sock.sendall((json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8'))
+
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('server closed the connection')
+
+        response = json.loads(line)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response
+
+    def format(self, content, **options):
+        """格式化内容并返回结果"""
+        if self.sock is None:
+            from .formatter import format
+            return format(content, output=None, **options)
+
+        return self.call({'content': content, 'options': options})['result']
+
+    def format_path(self, filepath, **options):
+        """原地格式化文件，返回内容是否发生变化"""
+        if self.sock is None:
+            from .batch import format_path
+            return format_path(filepath, **options)
+
+        return self.call({'path': os.path.abspath(filepath), 'options': options})['changed']
+
+
+def main():
+    parser = ArgumentParser(prog='python -m prettymd.client')
+    parser.add_argument('files', metavar='FILE', nargs='*')
+    parser.add_argument('-r --reindex-headers', dest='reindex_headers', action='store_true', default=False)
+    parser.add_argument('-p --py-prompt', dest='py_prompt', default='shell')
+    parser.add_argument('-n --newline-between-headers', dest='newline_between_headers', action='store_true', default=False)
+    parser.add_argument('-s --style', dest='style', default=None)
+    parser.add_argument('-e --engine', dest='engine', default='char')
+    parser.add_argument('--socket', dest='socket', default=None)
+
+    args = parser.parse_args(args=sys.argv[1:])
+    options = dict(style=args.style,
+                   reindex_headers=args.reindex_headers,
+                   py_prompt=args.py_prompt,
+                   newline_between_headers=args.newline_between_headers,
+                   engine=args.engine)
+
+    with Client(args.socket) as client:
+        if not args.files:
+            print(client.format(sys.stdin.read(), **options))
+            return
+
+        for filepath in args.files:
+            if client.format_path(filepath, **options):
+                print('formatted %s' % filepath)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,122 +1,538 @@
+import importlib
 import os
 import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from itertools import islice
 from pathlib import Path
+from string import ascii_letters, digits
+from tempfile import SpooledTemporaryFile
+
+from .lexer import PROSE_BLOCKS, lex_blocks
+
+# 流式输出时暂存在内存中的内容大小，超出后写入临时文件
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# 字符类别标记，通过 CHAR_FLAGS 一次查表得到
+EN = 1
+EN_MARK = 2
+ZH = 4
+ZH_MARK = 8
+REQUIRE_SPACE = 16
+
+EN_CHARS = ascii_letters + digits + "_\\[]{}*'&#$()"
+EN_MARKS = '\'":;()/'
+ZH_MARKS = '，。（）：、'
+SPACE_CHARS = '-`=.,'
+
+
+def build_char_flags():
+    flags = dict.fromkeys(map(chr, range(0x4e00, 0x9fa6)), ZH)
+
+    for char in ZH_MARKS:
+        flags[char] = ZH | ZH_MARK
+
+    for chars, flag in ((EN_CHARS, EN), (EN_MARKS, EN_MARK), (SPACE_CHARS, 0)):
+        for char in chars:
+            flags[char] = flags.get(char, 0) | flag | REQUIRE_SPACE
+
+    return flags
+
+
+CHAR_FLAGS = build_char_flags()
+
+# 连续的需要添加空白的字符，即英文、代码及英文标点组成的字符段
+ACTIVE_RUN = re.compile('[%s]+' % re.escape(EN_CHARS + EN_MARKS + SPACE_CHARS))
+NON_BLANK = re.compile(r'\S')
+
+# 不需要格式化的内容：链接和图片整体跳过，行内代码和网址只处理首尾字符
+# 链接文本中只允许一层成对的方括号，链接文本和地址都不跨越其他方括号，
+# 没有配对的 [ 最多向后查找到下一个方括号，长行中大量的 [ 不会反复扫描到行尾
+URL_CHARS = '^\\s<>()\\[\\]{}`"\'，。（）：、\u4e00-\u9fa5'
+PROTECTED_SPAN = re.compile(
+    r'(?P<link>!?\[(?:[^\[\]\n]|\[[^\[\]\n]*\])*\]\([^\[\])\n]*\))'
+    r'|(?P<code>`[^`]+`)'
+    r'|(?P<url>https?://[%s]*[%s.,;:!?])' % (URL_CHARS, URL_CHARS)
+)
+
+# 查找前后字符时链接所代表的字符
+SPAN_WORD = '\ufffc'
+
+HEADER = re.compile(r'^#+?\s')
+HEADER_INDEX = re.compile(r'^\d[\d\.]+\.\s')
+TABLE_SPLIT = re.compile(r'^-+?|-+?')
+
+# ipython 的提示符，可以替换单独的一行或整个代码块；输出之后紧跟的续行提示符与依次替换时一样变为 '... '
+IPYTHON_PROMPT = re.compile(
+    r'^(?:(?P<input>In \[\d+\]: )'
+    r'|(?P<output>Out\[\d+\]: )(?P<output_continue>[^\S\n]*\.\.\.: )?'
+    r'|(?P<continue>[^\S\n]*\.\.\.: ))',
+    re.M
+)
+
+# IPYTHON_PROMPT 中每一组替换为 shell 风格的提示符
+SHELL_PROMPTS = {'input': '>>> ', 'output': '', 'output_continue': '... ', 'continue': '... '}
+
+# 只替换这些语言的代码块中的提示符
+PROMPT_LANGUAGES = ('python', 'python3', 'py', 'ipython', 'ipython3', 'pycon')
+
+
+def fence_language(line):
+    """返回代码块开头 ``` 之后的语言，例如 '```python title="a.py"' 为 python"""
+    words = line.strip()[3:].split(maxsplit=1)
+    return words[0].strip('{.}').lower() if words else ''
+
+
+def shell_prompt(match):
+    return SHELL_PROMPTS[match.lastgroup]
+
+
+class LineCache(object):
+    """行级别的 LRU 缓存，以 (code_quote, 行内容) 为键，在同一进程的所有文档间共享
+
+    超过 max_line_length 的行不会被缓存。
+    """
+
+    def __init__(self, maxsize=4096, max_line_length=1024):
+        self.maxsize = maxsize
+        self.max_line_length = max_line_length
+        self.lines = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            new_line = self.lines.get(key)
+            if new_line is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.lines.move_to_end(key)
+            return new_line
+
+    def set(self, key, new_line):
+        with self.lock:
+            self.lines[key] = new_line
+            while len(self.lines) > self.maxsize:
+                self.lines.popitem(last=False)
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses, size=len(self.lines), maxsize=self.maxsize)
+
+    def clear(self):
+        with self.lock:
+            self.lines.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+LINE_CACHE = LineCache()
+
+
+class FormatStats(object):
+    """格式化过程的统计信息
+
+    通过 stats 参数传给 Formatter，记录各阶段的耗时、各类行的数量、处理的字符数和缓存命中次数；
+    同一个对象可以累计多个文档，但不要在多个线程中同时使用。
+    """
+
+    STAGES = ('total', 'blocks', 'line_engine', 'spans', 'py_prompt', 'headers')
+
+    def __init__(self):
+        self.times = Counter()
+        self.lines = Counter()
+        self.counters = Counter()
+
+    def add_time(self, stage, seconds):
+        self.times[stage] += seconds
+
+    def timed(self, stage, func):
+        """返回记录 func 耗时的函数"""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[stage] += time.perf_counter() - start
+        return wrapper
+
+    def merge(self, other):
+        self.times.update(other.times)
+        self.lines.update(other.lines)
+        self.counters.update(other.counters)
+
+    def as_dict(self):
+        times = dict.fromkeys(self.STAGES, 0.0)
+        times.update(self.times)
+        # 分块的耗时为总耗时中除行格式化、提示符替换和标题索引以外的部分
+        times['blocks'] = max(0.0, self.times['total'] - self.times['line_engine']
+                              - self.times['py_prompt'] - self.times['headers'])
+        return dict(times=times, lines=dict(self.lines), counters=dict(self.counters))
+
+    def report(self):
+        data = self.as_dict()
+        rows = ['%-20s %10.4fs' % ('time ' + stage, data['times'].get(stage, 0.0)) for stage in self.STAGES]
+        rows.extend('%-20s %10d' % ('lines ' + block, count) for block, count in sorted(self.lines.items()))
+        rows.extend('%-20s %10d' % (name, count) for name, count in sorted(self.counters.items()))
+        return '\n'.join(rows)
+
+
+class CompiledFormatter(object):
+    """按参数准备一次、可重复使用的格式化器
+
+    参数在创建时校验，字符表和正则表达式在模块中预先编译并只读共享；
+    每次调用 format 都使用新的 Formatter 保存文档的状态，因此可以重复调用，也可以在多个线程中同时调用。
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['output'] = None
+        Formatter(None, **kwargs)
+        self.options = kwargs
+
+    def format(self, content):
+        return Formatter(content, **self.options).format()
+
+    def format_stream(self, lines):
+        return Formatter(lines, **self.options).iter_lines()
 
 
 class Formatter(object):
+    __slots__ = ('content', 'style', 'output', 'py_prompt', 'newline_between_headers', 'reindex_headers', 'engine',
+                 'line_cache', 'stats', 'new_lines', 'table_started', 'code_block_started', 'code_prompt',
+                 'code_quote', 'header_formatter', 'desc_started', 'last_line', 'line_count', 'set_py_prompt',
+                 'set_code_block_py_prompt', 'line_formatter_class', 'line_formatter')
+
     def __init__(self,
                  content,
                  style=None,
                  output=None,
                  py_prompt='shell',
                  newline_between_headers=False,
-                 reindex_headers=True):
+                 reindex_headers=True,
+                 engine='char',
+                 line_cache=False,
+                 stats=None):
         self.content = content
         self.style = style
         self.output = output
         self.py_prompt = py_prompt
         self.newline_between_headers = newline_between_headers
         self.reindex_headers = reindex_headers
-        self.links = {}
+        self.engine = engine
+        self.line_cache = LINE_CACHE if line_cache else None
+        self.stats = stats
         self.new_lines = []
         self.table_started = False
         self.code_block_started = False
+        # 当前代码块是否需要替换提示符
+        self.code_prompt = False
         self.code_quote = '`'
         self.header_formatter = HeaderFormatter(self.new_lines)
         self.desc_started = False
+        self.last_line = None
+        self.line_count = 0
 
         if self.style != 'code':
             self.code_quote = ''
 
         if self.py_prompt == 'shell':
             self.set_py_prompt = self.set_py_prompt_shell
+            self.set_code_block_py_prompt = self.set_code_block_py_prompt_shell
         elif self.py_prompt == 'ipython':
             self.set_py_prompt = self.set_py_prompt_ipython
+            self.set_code_block_py_prompt = self.set_py_prompt_ipython
         else:
             raise ValueError('unknown py_prompt')
 
+        self.line_formatter_class = get_line_engine(self.engine)
+        # 同一个文档的所有行使用同一个行格式化引擎
+        self.line_formatter = None
+
+        if self.stats is not None:
+            self.set_py_prompt = self.stats.timed('py_prompt', self.set_py_prompt)
+            self.set_code_block_py_prompt = self.stats.timed('py_prompt', self.set_code_block_py_prompt)
+
     def format(self):
         if self.new_lines:
             return self.output_result()
 
-        if hasattr(self.content, 'read'):
-            self.content = self.content.read()
+        start = time.perf_counter()
+        if isinstance(self.content, str):
+            self.process_blocks(self.content.splitlines())
+        else:
+            self.new_lines.extend(self.process_lines(self.read_lines()))
 
-        raw_lines = self.content.splitlines()
+        if self.reindex_headers:
+            self.set_headers()
 
-        for index, line in enumerate(raw_lines):
+        self.add_document_time(time.perf_counter() - start)
 
-            if self.is_in_code_block(line):
-                line = self.set_py_prompt(line)
-                self.new_lines.append(line)
-                continue
+        return self.output_result()
 
-            if line.isspace() or not line:
-                if self.new_lines and self.new_lines[-1].startswith('>'):
-                    self.new_lines.append('\n')
-                continue
+    def set_headers(self):
+        """为所有标题补上索引"""
+        start = time.perf_counter()
+        self.header_formatter.set()
+        if self.stats is not None:
+            self.stats.add_time('headers', time.perf_counter() - start)
 
-            if self.desc_started:
-                self.new_lines.append(line)
-                continue
+    def add_document_time(self, seconds):
+        """记录处理完一个文档的总耗时"""
+        if self.stats is not None:
+            self.stats.add_time('total', seconds)
+            self.stats.counters['documents'] += 1
+
+    def iter_lines(self):
+        """逐行生成格式化后的内容
+
+        需要重建标题索引时，已格式化的内容会暂存在临时文件中，
+        待所有标题确定后再补上索引并输出。
+        """
+        lines = self.iter_formatted_lines()
+        if self.stats is None:
+            return lines
+
+        return self.timed_lines(lines)
+
+    def timed_lines(self, lines):
+        """生成 lines 中的各行，总耗时只计算生成各行的时间，不含调用方处理各行的时间"""
+        seconds = 0.0
+        start = time.perf_counter()
+
+        for line in lines:
+            seconds += time.perf_counter() - start
+            yield line
+            start = time.perf_counter()
+
+        self.add_document_time(seconds + time.perf_counter() - start)
+
+    def iter_formatted_lines(self):
+        lines = self.process_lines(self.read_lines())
+
+        if not self.reindex_headers:
+            yield from lines
+            return
+
+        self.header_formatter = HeaderFormatter({})
+        headers = self.header_formatter.headers
+        header_lines = self.header_formatter.lines
+        header_rows = {}
+        row = 0
 
-            if self.is_split(line):
-                self.new_lines.append(line)
+        with SpooledTemporaryFile(max_size=SPOOL_SIZE, mode='w+', encoding='utf-8', newline='\n') as f:
+            for index, line in enumerate(lines):
+                if headers and headers[-1] == index:
+                    header_lines[index] = line
+                    header_rows[index] = row
 
-                if not index:
-                    self.desc_started = True
+                f.write(line + '\n')
+                row += line.count('\n') + 1
 
-                elif self.desc_started:
-                    self.desc_started = False
+            self.set_headers()
+            patched = {header_rows[index]: line for index, line in header_lines.items()}
 
+            f.seek(0)
+            for row, line in enumerate(f):
+                yield patched.get(row, line[:-1])
+
+    def check(self):
+        """判断 content 是否已经格式化，即格式化前后内容相同
+
+        逐行与原内容比较，遇到第一处不同即停止；需要重建标题索引时，标题行在最后补上索引后再比较。
+        """
+        start = time.perf_counter()
+        try:
+            return self.check_lines()
+        finally:
+            self.add_document_time(time.perf_counter() - start)
+
+    def check_lines(self):
+        content = self.content
+        if not isinstance(content, str):
+            content = ''.join(content)
+            self.content = content
+
+        if self.reindex_headers:
+            self.header_formatter = HeaderFormatter({})
+
+        headers = self.header_formatter.headers
+        header_lines = self.header_formatter.lines
+        raw_headers = {}
+        pos = 0
+
+        for index, line in enumerate(self.process_lines(self.read_lines())):
+            if index:
+                if content[pos:pos + 1] != '\n':
+                    return False
+                pos += 1
+
+            if self.reindex_headers and headers and headers[-1] == index:
+                end = content.find('\n', pos)
+                end = len(content) if end == -1 else end
+                header_lines[index] = line
+                raw_headers[index] = content[pos:end]
+                pos = end
                 continue
 
-            is_header = self.is_header(line)
+            if not content.startswith(line, pos):
+                return False
+            pos += len(line)
+
+        if pos != len(content):
+            return False
+
+        if self.reindex_headers:
+            self.set_headers()
+            return all(header_lines[index] == line for index, line in raw_headers.items())
 
-            if is_header and self.new_lines and not self.is_header(self.new_lines[-1]):
-                if self.newline_between_headers:
-                    self.new_lines.append('\n<br/>\n')
+        return True
 
-            if '|' in line:
-                if not self.table_started:
-                    try:
-                        next_line = raw_lines[index + 1]
-                    except IndexError:
-                        next_line = ''
+    def read_lines(self):
+        if isinstance(self.content, str):
+            yield from self.content.splitlines()
+            return
 
-                    if re.match(r'^-+?|-+?', next_line):
-                        self.table_started = True
+        # 文件对象或其他按行迭代的对象
+        for line in self.content:
+            yield from line.splitlines() or ['']
+
+    def process_blocks(self, lines):
+        """先分块再格式化，代码块、表格等直接整块复制，只有标题、引用和段落交给行格式化引擎
+
+        结果与逐行调用 process_line 相同。
+        """
+        new_lines = self.new_lines
+        blocks = lex_blocks(lines)
 
-            elif self.table_started:
-                self.table_started = False
+        # 所有需要格式化的行一次交给行格式化引擎
+        prose_lines = [lines[index] for kind, start, end in blocks if kind in PROSE_BLOCKS
+                       for index in range(start, end)]
+        formatted_lines = iter(self.format_lines(prose_lines))
 
-            if is_header:
-                self.header_formatter.add_header()
+        for kind, start, end in blocks:
+            block = lines[start:end]
+
+            if self.stats is not None:
+                self.stats.lines['table' if kind == 'table_header' else kind] += end - start
+                self.stats.counters['chars'] += sum(map(len, block))
+
+            if kind == 'code':
+                # 每个代码块从 ``` 开始，其他语言的代码块整块复制
+                if fence_language(block[0]) in PROMPT_LANGUAGES:
+                    new_lines.extend(self.set_code_block_py_prompt(block))
+                else:
+                    new_lines.extend(block)
+
+            elif kind == 'blank':
+                if new_lines and new_lines[-1].startswith('>'):
+                    new_lines.append('\n')
+
+            elif kind == 'header' or kind == 'table_header':
+                for line in block:
+                    if self.newline_between_headers and new_lines and not self.is_header(new_lines[-1]):
+                        new_lines.append('\n<br/>\n')
+
+                    self.header_formatter.add_header(len(new_lines))
+                    new_lines.append(next(formatted_lines) if kind == 'header' else line)
+
+            elif kind == 'paragraph' or kind == 'quote':
+                new_lines.extend(islice(formatted_lines, end - start))
 
-            if self.table_started:
-                self.new_lines.append(line)
             else:
-                self.new_lines.append(self.format_line(line))
+                new_lines.extend(block)
 
-        if self.reindex_headers:
-            self.header_formatter.set()
+        self.last_line = new_lines[-1] if new_lines else None
+        self.line_count = len(new_lines)
 
-        return self.output_result()
+    def process_lines(self, raw_lines):
+        for index, (line, next_line) in enumerate(self.pair_lines(raw_lines)):
+            yield from self.process_line(index, line, next_line)
 
-    def output_result(self):
-        new_text = '\n'.join(self.new_lines)
+    def process_line(self, index, line, next_line):
+        """格式化一行，next_line 用于判断表格是否开始"""
+        if self.stats is not None:
+            self.stats.counters['chars'] += len(line)
 
-        if self.output is None:
-            return new_text
+        if self.is_in_code_block(line):
+            self.count_line('code')
+            if self.code_prompt:
+                line = self.set_py_prompt(line)
+            yield self.emit(line)
+            return
 
-        if self.output == 'stream':
-            return print(new_text)
+        if line.isspace() or not line:
+            self.count_line('blank')
+            if self.last_line is not None and self.last_line.startswith('>'):
+                yield self.emit('\n')
+            return
+
+        if self.desc_started:
+            self.count_line('desc')
+            yield self.emit(line)
+            return
 
-        with Path(self.output).open('w', encoding='utf-8') as f:
-            f.write(new_text)
+        if self.is_split(line):
+            self.count_line('split')
+            yield self.emit(line)
+
+            if not index:
+                self.desc_started = True
+
+            elif self.desc_started:
+                self.desc_started = False
+
+            return
+
+        is_header = self.is_header(line)
+
+        if is_header and self.last_line is not None and not self.is_header(self.last_line):
+            if self.newline_between_headers:
+                yield self.emit('\n<br/>\n')
+
+        if '|' in line:
+            if not self.table_started:
+                if TABLE_SPLIT.match(next_line):
+                    self.table_started = True
+
+        elif self.table_started:
+            self.table_started = False
+
+        if is_header:
+            self.header_formatter.add_header(self.line_count)
+
+        if self.table_started:
+            self.count_line('table')
+            yield self.emit(line)
+        else:
+            self.count_line('header' if is_header else 'quote' if line.startswith('>') else 'paragraph')
+            yield self.emit(self.format_line(line))
+
+    def count_line(self, block):
+        if self.stats is not None:
+            self.stats.lines[block] += 1
+
+    def pair_lines(self, lines):
+        """生成每一行及其下一行"""
+        lines = iter(lines)
+        line = next(lines, None)
+
+        while line is not None:
+            next_line = next(lines, None)
+            yield line, '' if next_line is None else next_line
+            line = next_line
+
+    def emit(self, line):
+        self.last_line = line
+        self.line_count += 1
+        return line
+
+    def output_result(self):
+        return write_output('\n'.join(self.new_lines), self.output)
 
     def is_header(self, line):
-        return re.match(r'^#+?\s', line)
+        return HEADER.match(line)
 
     def is_split(self, line):
         """判断该行是否为分割符"""
@@ -129,8 +545,10 @@ class Formatter(object):
 
         if not self.code_block_started:
             self.code_block_started = True
+            self.code_prompt = fence_language(line) in PROMPT_LANGUAGES
         else:
             self.code_block_started = False
+            self.code_prompt = False
 
         return True
 
@@ -138,10 +556,12 @@ class Formatter(object):
         """将 python 的提示符设置为 shell 的风格
         ex: ">>> print(\n)"
         """
-        line = re.sub(r'^In \[\d+\]: ', '>>> ', line)
-        line = re.sub(r'^Out\[\d+\]: ', '', line)
-        line = re.sub(r'^\s*\.\.\.: ', '... ', line)
-        return line
+        return IPYTHON_PROMPT.sub(shell_prompt, line)
+
+    def set_code_block_py_prompt_shell(self, lines):
+        """一次替换整个代码块中的提示符"""
+        text = '\n'.join(lines)
+        return IPYTHON_PROMPT.sub(shell_prompt, text).split('\n')
 
     def set_py_prompt_ipython(self, line):
         """将 python 的提示符设置为 ipython 的风格
@@ -152,41 +572,174 @@ class Formatter(object):
         """
         return line
 
+    def format_lines(self, lines):
+        """格式化多行，没有启用行缓存时整批交给行格式化引擎"""
+        if self.line_cache is not None:
+            return [self.format_line(line) for line in lines]
+
+        if self.stats is None:
+            return self.line_formatter_class.format_lines(lines, self.code_quote)
+
+        start = time.perf_counter()
+        new_lines = self.line_formatter_class.format_lines(lines, self.code_quote, self.stats)
+        self.stats.add_time('line_engine', time.perf_counter() - start)
+        return new_lines
+
     def format_line(self, line):
-        return LineFormatter(line, self.code_quote).format()
+        if self.stats is None:
+            return self.format_cached_line(line)
+
+        start = time.perf_counter()
+        try:
+            return self.format_cached_line(line)
+        finally:
+            self.stats.add_time('line_engine', time.perf_counter() - start)
+
+    def format_cached_line(self, line):
+        if self.line_cache is None or len(line) > self.line_cache.max_line_length:
+            return self.run_line_formatter(line)
+
+        key = (self.code_quote, line)
+        new_line = self.line_cache.get(key)
+
+        if self.stats is not None:
+            self.stats.counters['line_cache_misses' if new_line is None else 'line_cache_hits'] += 1
+
+        if new_line is None:
+            new_line = self.run_line_formatter(line)
+            self.line_cache.set(key, new_line)
+
+        return new_line
+
+    def run_line_formatter(self, line):
+        """复用同一个行格式化引擎，不必为每一行创建新的对象"""
+        if self.line_formatter is None:
+            self.line_formatter = self.line_formatter_class(line, self.code_quote, self.stats)
+        else:
+            self.line_formatter.reset(line)
+        return self.line_formatter.format()
 
 
 class LineFormatter(object):
+    __slots__ = ('line', 'code_quote', 'stats', 'index', 'new_words', 'half_quoted', 'quote_start_index', 'spans',
+                 'verbatim_spans', 'opaque_edges', 'next_indexes', 'prev_indexes', 'first_word_index')
 
-    def __init__(self, line, code_quote):
-        self.line = line
+    def __init__(self, line, code_quote, stats=None):
         self.code_quote = code_quote
-        self.index = 0
+        self.stats = stats
         self.new_words = []
+        self.spans = []
+        self.verbatim_spans = {}
+        self.opaque_edges = set()
+        self.next_indexes = []
+        self.prev_indexes = []
+        self.reset(line)
+
+    def reset(self, line):
+        """清空上一行的状态以格式化新的一行，列表等容器清空后继续使用"""
+        self.line = line
+        self.index = 0
         self.half_quoted = False
         self.quote_start_index = None
-        self.links = {}
+        self.first_word_index = 0
+        self.new_words.clear()
+        self.spans.clear()
+        self.verbatim_spans.clear()
+        self.opaque_edges.clear()
+
+    @classmethod
+    def format_lines(cls, lines, code_quote, stats=None):
+        """格式化多行，可以一次处理整批内容的引擎重写这个方法"""
+        formatter = cls('', code_quote, stats)
+        new_lines = []
+
+        for line in lines:
+            formatter.reset(line)
+            new_lines.append(formatter.format())
+
+        return new_lines
+
+    def find_spans(self):
+        """一次查找链接、图片、行内代码和网址等不需要格式化的内容"""
+        start_time = time.perf_counter() if self.stats is not None else None
+
+        for match in PROTECTED_SPAN.finditer(self.line):
+            start, end = match.span()
+            self.add_span(start, end, match.lastgroup == 'link')
+
+        if start_time is not None:
+            self.stats.add_time('spans', time.perf_counter() - start_time)
+
+    def add_span(self, start, end, opaque):
+        """记录不需要格式化的内容，opaque 为 True 时整体跳过，否则只处理首尾字符"""
+        self.spans.append((start, end, opaque))
+
+        if opaque:
+            self.opaque_edges.update((start, end - 1))
+        else:
+            self.verbatim_spans[start] = end
+
+    def index_blanks(self):
+        """预先计算每个位置前后非空白字符的索引，使整行的处理为线性复杂度
+
+        查找时跳过受保护内容的内部，链接只保留首尾各一个位置。
+        """
+        line = self.line
+        length = len(line)
+        next_indexes = self.next_indexes
+        prev_indexes = self.prev_indexes
+
+        # 只会读取前 length 个位置，下面的循环会全部重新赋值，因此只在不够长时扩充
+        if len(next_indexes) < length:
+            next_indexes.extend([length] * (length - len(next_indexes)))
+            prev_indexes.extend([-1] * (length - len(prev_indexes)))
+
+        hidden_next = bytearray(length)
+        hidden_prev = bytearray(length)
+        for start, end, opaque in self.spans:
+            size = end - start - 2 + opaque
+            hidden_next[start + 1:start + 1 + size] = b'\1' * size
+            hidden_prev[end - 1 - size:end - 1] = b'\1' * size
+
+        next_index = length
+        for index in range(length - 1, -1, -1):
+            next_indexes[index] = next_index
+            if not hidden_next[index] and not line[index].isspace():
+                next_index = index
+
+        # 第一个非空白字符的索引
+        self.first_word_index = next_index
+
+        prev_index = -1
+        for index in range(length):
+            prev_indexes[index] = prev_index
+            if not hidden_prev[index] and not line[index].isspace():
+                prev_index = index
 
     def next_non_blank_word(self):
         """获取下一个非空白字符和索引"""
-        next_index = self.index + 1
-        next_word = ''
-        while next_index < len(self.line):
-            next_word = self.line[next_index]
-            if not next_word.isspace():
-                break
-            next_index += 1
+        next_index = self.next_indexes[self.index]
+        if next_index in self.opaque_edges:
+            # 链接与两侧的内容之间视为有空白
+            return SPAN_WORD, next_index + 1
+
+        if next_index < len(self.line):
+            return self.line[next_index], next_index
+
+        # 后面只有空白字符时返回最后一个字符
+        next_word = self.line[-1] if self.index + 1 < next_index else ''
         return next_word, next_index
 
     def prev_non_blank_word(self):
         """获取前一个非空白字符和索引"""
-        pre_index = self.index - 1
-        pre_word = ''
-        while pre_index >= 0:
-            pre_word = self.line[pre_index]
-            if not pre_word.isspace():
-                break
-            pre_index -= 1
+        pre_index = self.prev_indexes[self.index]
+        if pre_index in self.opaque_edges:
+            return SPAN_WORD, pre_index - 1
+
+        if pre_index >= 0:
+            return self.line[pre_index], pre_index
+
+        pre_word = self.line[0] if self.index else ''
         return pre_word, pre_index
 
     def is_bold_quote(self):
@@ -207,26 +760,57 @@ class LineFormatter(object):
         self.new_words.append(word)
 
     def format(self):
-        self.remove_links()
+        self.find_spans()
+        self.index_blanks()
 
-        while self.index < len(self.line):
-            index_before_process = self.index
+        line = self.line
 
-            self.process()
+        for start, end, opaque in self.spans:
+            self.format_chars(start)
+
+            if opaque:
+                self.add_word(line[start:end])
+            else:
+                self.format_verbatim_span(start, end)
+
+            self.index = end
+
+        self.format_chars(len(line))
+
+        return ''.join(self.new_words)
 
-            if self.index == index_before_process:
+    def format_chars(self, end):
+        """逐个处理到 end 为止需要添加空白的字符，其余的字符不会改变，按切片整段复制"""
+        line = self.line
+
+        while self.index < end:
+            match = ACTIVE_RUN.search(line, self.index, end)
+            run_start, run_end = match.span() if match else (end, end)
+
+            if run_start > self.index:
+                self.add_word(line[self.index:run_start])
+
+            self.index = run_start
+            while self.index < run_end:
+                self.process()
                 self.index += 1
 
-        line = ''.join(self.new_words)
-        return self.recover_links(line)
+    def format_verbatim_span(self, start, end):
+        """只处理行内代码和网址的首尾字符，中间的内容保持不变"""
+        self.index = start
+        self.process()
+        self.add_word(self.line[start + 1:end - 1])
+        self.index = end - 1
+        self.process()
 
     def process(self):
         word = self.word
+        flags = CHAR_FLAGS.get(word, 0)
 
-        if not self.require_space(word):
+        if not flags & REQUIRE_SPACE:
             return self.add_word()
 
-        if not self.index or all(w.isspace() for w in self.new_words):
+        if self.index <= self.first_word_index:
             # 第一个非空白字符
             if word in '#-' or word.isdigit():
                 self.add_word()
@@ -241,6 +825,7 @@ class LineFormatter(object):
         elif self.half_quoted:
             # 下一个非空白字符
             next_word, next_index = self.next_non_blank_word()
+            next_flags = CHAR_FLAGS.get(next_word, 0)
             blank_exists = next_index > self.index + 1
 
             if not next_word:
@@ -248,14 +833,14 @@ class LineFormatter(object):
                 self.add_quote()
                 return
 
-            if self.require_space(next_word):
+            if next_flags & REQUIRE_SPACE:
                 self.add_word(word)
 
             else:
                 self.add_word(word)
                 self.add_quote()
 
-                if not blank_exists and not self.is_zh_mark(next_word):
+                if not blank_exists and not next_flags & ZH_MARK:
                     self.add_word(' ')
 
         elif self.is_bold_quote():
@@ -265,31 +850,33 @@ class LineFormatter(object):
             # 根据前后字符处理
             # 前一个字符
             prev_word, prev_index = self.prev_non_blank_word()
+            prev_flags = CHAR_FLAGS.get(prev_word, 0)
             prev_blank_exists = prev_index + 1 < self.index
 
             # 下一个非空白字符
             next_word, next_index = self.next_non_blank_word()
+            next_flags = CHAR_FLAGS.get(next_word, 0)
             blank_exists = next_index > self.index + 1
 
-            if self.is_zh(prev_word):
-                if self.is_en_mark(word) and (not next_word or self.is_zh(next_word)):
+            if prev_flags & ZH:
+                if flags & EN_MARK and (not next_word or next_flags & ZH):
                     return self.add_word(word)
 
-                if not self.is_zh_mark(prev_word) and not prev_blank_exists:
+                if not prev_flags & ZH_MARK and not prev_blank_exists:
                     self.add_word(' ')
 
                 self.add_quote()
                 self.add_word(word)
 
-                if self.is_zh(next_word):
+                if next_flags & ZH:
                     self.add_quote()
-                    if not self.is_zh_mark(next_word) and not blank_exists:
+                    if not next_flags & ZH_MARK and not blank_exists:
                         self.add_word(' ')
 
                 return
 
             # 如果前面字符不需要处理，看后面的字符
-            if self.is_zh(next_word) and not self.is_zh_mark(next_word):
+            if next_flags & ZH and not next_flags & ZH_MARK:
                 self.add_word(word)
                 if not blank_exists:
                     self.add_word(' ')
@@ -315,50 +902,168 @@ class LineFormatter(object):
 
     def require_space(self, string):
         """判断字符是否为需要添加空白的字符"""
-        return self.is_en(string) or self.is_en_mark(string) or string in ['-', '`', '=', '.', ',']
+        return CHAR_FLAGS.get(string, 0) & REQUIRE_SPACE
 
     def is_zh(self, string):
         """判断字符是否为中文字符"""
-        return string and ('\u4e00' <= string <= '\u9fa5' or self.is_zh_mark(string))
+        return CHAR_FLAGS.get(string, 0) & ZH
 
     def is_zh_mark(self, string):
         """判断字符是否为中文标点符号"""
-        return string in '，。（）：、'
+        return CHAR_FLAGS.get(string, 0) & ZH_MARK
 
     def is_mark(self, string):
-        return string and (self.is_zh_mark(string) or self.is_en_mark(string))
+        return CHAR_FLAGS.get(string, 0) & (ZH_MARK | EN_MARK)
 
     def is_en(self, string):
-        return re.match(r'[a-zA-Z0-9_\\\[\]\{\}\*\'&#\$\(\)]', string)
+        return CHAR_FLAGS.get(string, 0) & EN
 
     def is_en_mark(self, string):
-        return string in ("'", '"', ':', ';', '(', ')', '/')
+        return CHAR_FLAGS.get(string, 0) & EN_MARK
+
+
+class RunLineFormatter(LineFormatter):
+    """按字符段处理的格式化引擎
+
+    英文字符段内部的字符不会改变输出，只需在字符段的首尾字符上执行 process，
+    其余内容按切片整段复制，输出与 LineFormatter 一致。
+    """
+    __slots__ = ('prev_index',)
+
+    def index_blanks(self):
+        self.first_word_index = self.find_non_blank(0)
+        self.prev_index = -1
+
+    def find_non_blank(self, index):
+        """返回 index 及之后第一个非空白字符的索引，不存在时返回行的长度"""
+        match = NON_BLANK.search(self.line, index)
+        return match.start() if match else len(self.line)
+
+    def iter_runs(self, start, end):
+        """生成 start 到 end 之间每个需要添加空白的字符段的起止索引"""
+        for match in ACTIVE_RUN.finditer(self.line, start, end):
+            yield match.span()
+
+    def next_non_blank_word(self):
+        end = self.verbatim_spans.get(self.index)
+        if end is not None:
+            # 行内代码和网址的首字符之后是尾字符
+            return self.line[end - 1], end - 1
+
+        next_index = self.find_non_blank(self.index + 1)
+        if next_index < len(self.line):
+            if next_index in self.opaque_edges:
+                return SPAN_WORD, next_index + 1
+            return self.line[next_index], next_index
 
-    def remove_links(self):
-        """移除内容中的链接"""
+        next_word = self.line[-1] if self.index + 1 < len(self.line) else ''
+        return next_word, len(self.line)
+
+    def prev_non_blank_word(self):
+        pre_index = self.prev_index
+        if pre_index in self.opaque_edges:
+            return SPAN_WORD, pre_index - 1
+
+        if pre_index >= 0:
+            return self.line[pre_index], pre_index
+
+        pre_word = self.line[0] if self.index else ''
+        return pre_word, pre_index
+
+    def format(self):
+        self.find_spans()
+        self.index_blanks()
+
+        start = 0
+
+        for span_start, span_end, opaque in self.spans:
+            self.format_runs(start, span_start)
+
+            if opaque:
+                self.add_word(self.line[span_start:span_end])
+            else:
+                self.format_verbatim_span(span_start, span_end)
+
+            self.prev_index = span_end - 1
+            start = span_end
+
+        self.format_runs(start, len(self.line))
+        return ''.join(self.new_words)
+
+    def format_verbatim_span(self, start, end):
+        self.index = start
+        self.process()
+        self.prev_index = start
+        self.add_word(self.line[start + 1:end - 1])
+        self.index = end - 1
+        self.process()
+
+    def format_runs(self, start, end):
+        """格式化 start 到 end 之间的内容"""
         line = self.line
-        links = re.findall(r'!?\[.*?\]\(.*?\)', line)
 
-        for index, link in enumerate(set(links)):
-            placeholder = ' <LinkStashed(num=%s)> ' % index
-            line = line.replace(link, placeholder)
-            self.links[link] = placeholder
+        for run_start, run_end in self.iter_runs(start, end):
+            self.add_gap(start, run_start)
 
-        self.line = line
+            self.index = run_start
+            self.process()
+
+            if run_end - run_start > 1:
+                self.add_word(line[run_start + 1:run_end - 1])
+                self.prev_index = run_end - 2
+                self.index = run_end - 1
+                self.process()
+
+            self.prev_index = run_end - 1
+            start = run_end
+
+        self.add_gap(start, end)
+
+    def add_gap(self, start, end):
+        """复制不需要添加空白的内容，并记录其中最后一个非空白字符"""
+        if start >= end:
+            return
+
+        gap = self.line[start:end]
+        self.add_word(gap)
+
+        gap_end = len(gap.rstrip())
+        if gap_end:
+            self.prev_index = start + gap_end - 1
+
+
+# 可以通过 engine 参数选择的行格式化引擎，输出必须与 LineFormatter 一致，可以通过 prettymd.shadow 验证
+LINE_ENGINES = {
+    'char': LineFormatter,
+    'run': RunLineFormatter,
+}
+
+# 依赖可选库的引擎，使用时才导入
+LAZY_LINE_ENGINES = {
+    'numpy': ('prettymd.vectorized', 'LineEngine'),
+}
 
-    def recover_links(self, line):
-        for link, placeholder in self.links.items():
-            line = line.replace(placeholder, link)
-        return line
+
+def get_line_engine(name):
+    if name in LINE_ENGINES:
+        return LINE_ENGINES[name]
+
+    if name in LAZY_LINE_ENGINES:
+        module, attr = LAZY_LINE_ENGINES[name]
+        return getattr(importlib.import_module(module), attr)
+
+    raise ValueError('unknown engine')
 
 
 class HeaderFormatter(object):
+    __slots__ = ('lines', 'headers', 'current_index', 'max_level', 'top_level')
 
     def __init__(self, lines):
         self.lines = lines
         self.headers = []
         self.current_index = []
         self.max_level = None
+        self.top_level = None
 
     def add_header(self, index=None):
         if index is None:
@@ -366,6 +1071,11 @@ class HeaderFormatter(object):
         self.headers.append(index)
 
     def set(self):
+        for index, header_index in self.iter_indexes():
+            self.set_index(index, header_index)
+
+    def iter_indexes(self):
+        """按顺序生成每个标题所在的行和对应的索引"""
         if not self.headers:
             return
 
@@ -380,8 +1090,7 @@ class HeaderFormatter(object):
         self.top_level = min(level for level in levels.values())
 
         for index, level in levels.items():
-            header_index = self.get_index(level)
-            self.set_index(index, header_index)
+            yield index, self.get_index(level)
 
     def get_level(self, index):
         return len(self.lines[index].split(maxsplit=1)[0])
@@ -415,18 +1124,92 @@ class HeaderFormatter(object):
         self.lines[line_index] = line
 
     def remove_exists_index(self, line):
-        if re.match(r'^\d[\d\.]+\.\s', line):
+        if HEADER_INDEX.match(line):
             return line.split(maxsplit=1)[-1]
         return line
 
 
+def write_output(text, output):
+    """按 output 指定的方式输出格式化后的内容，写入文件时返回是否写入"""
+    if output is None:
+        return text
+
+    if output == 'stream':
+        return print(text)
+
+    return write_file(output, text)
+
+
+def split_final_newline(content):
+    """分出文件末尾的一个换行符，返回 (正文, 换行符)
+
+    format 的结果末尾没有换行符，原地格式化和检查文件时只处理正文，写回时再补上原来的换行符。
+    """
+    if content.endswith('\n'):
+        return content[:-1], '\n'
+    return content, ''
+
+
+def write_file(filepath, text):
+    """写入文件，内容与原文件相同时不写入，返回是否写入
+
+    先比较大小再比较内容；需要写入时先写到同一目录下的临时文件再替换原文件，
+    避免原文件被写了一半，也不会修改内容未变化的文件的修改时间。
+    """
+    path = Path(os.path.realpath(filepath))
+    data = text.replace('\n', os.linesep).encode('utf-8')
+
+    try:
+        stat = path.stat()
+    except OSError:
+        stat = None
+    else:
+        if stat.st_size == len(data) and path.read_bytes() == data:
+            return False
+
+    tmp_path = path.with_name('.%s.%s.tmp' % (path.name, os.getpid()))
+
+    try:
+        with tmp_path.open('wb') as f:
+            f.write(data)
+        if stat is not None:
+            os.chmod(tmp_path, stat.st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+
+    return True
+
+
 def format(*args, **kwargs):
     return Formatter(*args, **kwargs).format()
 
 
-def format_file(filepath, **kwargs):
+def format_stream(lines, **kwargs):
+    """逐行格式化，返回生成格式化后各行的生成器"""
+    return Formatter(lines, **kwargs).iter_lines()
+
+
+def is_formatted(content, **kwargs):
+    """判断内容是否已经格式化，与 format(content) == content 相同，但遇到第一处不同即返回"""
+    kwargs['output'] = None
+    return Formatter(content, **kwargs).check()
+
+
+def format_file(filepath, cache=None, **kwargs):
+    """格式化文件，指定 cache 时内容未变化的文件直接使用缓存的结果"""
     _, name = os.path.split(filepath)
     kwargs.setdefault('output', name)
 
+    # 读出整个文件再格式化，与字符串内容一样经过块级的词法分析
     with open(filepath, 'r', encoding='utf-8') as f:
-        return format(f, **kwargs)
+        content = f.read()
+
+    if cache is None:
+        return format(content, **kwargs)
+
+    return cache.format(content, **kwargs)
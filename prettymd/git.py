@@ -0,0 +1,53 @@
+"""通过本地的 git 查找发生变化的 markdown 文件
+
+    $ python -m prettymd --changed-since origin/main -j 0
+    $ python -m prettymd --staged --check
+"""
+import os
+import subprocess
+
+from .batch import MARKDOWN_SUFFIXES
+
+
+def run_git(args, cwd=None):
+    try:
+        process = subprocess.run(['git'] + list(args), cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise ValueError('git is not available: %s' % e)
+
+    if process.returncode:
+        raise ValueError(process.stderr.decode('utf-8', 'replace').strip() or 'git %s failed' % args[0])
+
+    return process.stdout.decode('utf-8', 'surrogateescape')
+
+
+def changed_files(since=None, staged=False, cwd=None):
+    """返回工作区相对 since 发生变化的 markdown 文件，staged 为 True 时比较暂存区
+
+    since 为 None 时与 HEAD 比较；未跟踪和已删除的文件不会返回，路径相对于 cwd。
+    """
+    if since is not None and since.startswith('-'):
+        raise ValueError('invalid ref %s' % since)
+
+    cwd = cwd or os.getcwd()
+    root = run_git(['rev-parse', '--show-toplevel'], cwd=cwd).strip()
+
+    args = ['diff', '--name-only', '-z', '--no-renames', '--diff-filter=ACM']
+    if staged:
+        args.append('--cached')
+    if since is not None:
+        args.append(since)
+    elif not staged:
+        args.append('HEAD')
+    args.append('--')
+
+    files = []
+    for name in run_git(args, cwd=cwd).split('\0'):
+        if not name.endswith(MARKDOWN_SUFFIXES):
+            continue
+
+        path = os.path.join(root, name)
+        if os.path.isfile(path):
+            files.append(os.path.relpath(path, cwd))
+
+    return files
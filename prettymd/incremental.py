@@ -0,0 +1,169 @@
+"""增量格式化，供编辑器在保存时只重新格式化发生变化的部分"""
+from collections import namedtuple
+
+from .formatter import Formatter, HeaderFormatter
+
+# 开始处理某一行之前 Formatter 的分块状态
+Checkpoint = namedtuple('Checkpoint', [
+    'code_block_started', 'code_prompt', 'table_started', 'desc_started', 'last_line', 'line_count', 'header_count',
+])
+
+INITIAL_CHECKPOINT = Checkpoint(False, False, False, False, None, 0, 0)
+
+
+class IncrementalFormatter(object):
+    """保存上一次格式化时每一行的检查点，再次格式化时从第一处修改之前的检查点继续，
+    在修改之后分块状态与上一次一致时直接复用上一次的结果。
+
+        >>> formatter = IncrementalFormatter(style='code')
+        >>> text = formatter.format(document)
+        >>> text = formatter.update(new_document, [(10, 12)])
+
+    update 的结果与对 new_document 调用 format 相同。
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['output'] = None
+        self.options = kwargs
+        self.reset()
+
+    def reset(self):
+        self.raw_lines = []
+        self.checkpoints = [INITIAL_CHECKPOINT]
+        self.new_lines = []
+        self.headers = []
+        self.header_texts = {}
+        self.top_level = None
+
+    def format(self, text):
+        """完整格式化文档"""
+        self.reset()
+        return self.update(text, [(0, len(text.splitlines()))])
+
+    def update(self, text, changed_ranges=None):
+        """重新格式化修改后的文档
+
+        changed_ranges 为修改后文档中发生变化的行范围 [(start, end), ...]，不含 end，
+        为 None 时通过与上一次的文档比较得到。
+        """
+        lines = text.splitlines()
+        old_lines = self.raw_lines
+
+        if changed_ranges is None:
+            first, last = diff_lines(old_lines, lines)
+        elif changed_ranges:
+            first = min(start for start, _ in changed_ranges)
+            last = max(end for _, end in changed_ranges)
+        else:
+            first = last = len(lines)
+
+        # 第一处修改之前和最后一处修改之后的内容与上一次相同
+        first = min(first, len(old_lines), len(lines))
+        tail = min(len(lines) - max(last, first), len(old_lines) - first)
+        last = len(lines) - tail
+        delta = len(lines) - len(old_lines)
+
+        # 上一行是否为表格的开始取决于下一行，因此从修改的前一行开始
+        start = max(first - 1, 0)
+        checkpoint = self.checkpoints[start]
+
+        formatter = Formatter(None, **self.options)
+        formatter.code_block_started = checkpoint.code_block_started
+        formatter.code_prompt = checkpoint.code_prompt
+        formatter.table_started = checkpoint.table_started
+        formatter.desc_started = checkpoint.desc_started
+        formatter.last_line = checkpoint.last_line
+        formatter.line_count = checkpoint.line_count
+
+        new_lines = self.new_lines[:checkpoint.line_count]
+        headers = self.headers[:checkpoint.header_count]
+        header_texts = {index: self.header_texts[index] for index in headers} if formatter.reindex_headers else {}
+        checkpoints = self.checkpoints[:start]
+        formatter.header_formatter.headers = headers
+
+        for index in range(start, len(lines)):
+            current = self.checkpoint(formatter)
+            old_index = index - delta
+
+            if index >= last and (index == 0) == (old_index == 0) and same_block_state(current, self.checkpoints[old_index]):
+                # 分块状态与上一次相同，其余部分直接复用上一次的结果
+                old = self.checkpoints[old_index]
+                line_shift = current.line_count - old.line_count
+                header_shift = current.header_count - old.header_count
+
+                new_lines.extend(self.new_lines[old.line_count:])
+                for header in self.headers[old.header_count:]:
+                    headers.append(header + line_shift)
+                    if formatter.reindex_headers:
+                        header_texts[header + line_shift] = self.header_texts[header]
+
+                checkpoints.extend(
+                    old_checkpoint._replace(line_count=old_checkpoint.line_count + line_shift,
+                                            header_count=old_checkpoint.header_count + header_shift)
+                    for old_checkpoint in self.checkpoints[old_index:]
+                )
+                break
+
+            checkpoints.append(current)
+            next_line = lines[index + 1] if index + 1 < len(lines) else ''
+            header_count = len(headers)
+            new_lines.extend(formatter.process_line(index, lines[index], next_line))
+
+            if formatter.reindex_headers and len(headers) > header_count:
+                header_texts[headers[-1]] = new_lines[headers[-1]]
+        else:
+            checkpoints.append(self.checkpoint(formatter))
+
+        self.raw_lines = lines
+        self.checkpoints = checkpoints
+        self.new_lines = new_lines
+        self.headers = headers
+        self.header_texts = header_texts
+
+        if formatter.reindex_headers:
+            self.reindex_headers(checkpoint.header_count)
+
+        return '\n'.join(new_lines)
+
+    def checkpoint(self, formatter):
+        return Checkpoint(formatter.code_block_started, formatter.code_prompt, formatter.table_started,
+                          formatter.desc_started, formatter.last_line, formatter.line_count,
+                          len(formatter.header_formatter.headers))
+
+    def reindex_headers(self, first_header):
+        """为标题重建索引
+
+        最上层标题的级别不变时，第一个修改的标题之前的索引不会变化，只更新其后的标题。
+        """
+        header_formatter = HeaderFormatter(dict(self.header_texts))
+        header_formatter.headers = self.headers
+        indexes = list(header_formatter.iter_indexes())
+        top_level = getattr(header_formatter, 'top_level', None)
+
+        if top_level != self.top_level:
+            first_header = 0
+
+        for index, header_index in indexes[first_header:]:
+            header_formatter.set_index(index, header_index)
+            self.new_lines[index] = header_formatter.lines[index]
+
+        self.top_level = top_level
+
+
+def same_block_state(checkpoint, other):
+    return checkpoint[:5] == other[:5]
+
+
+def diff_lines(old_lines, lines):
+    """返回新文档中发生变化的行范围"""
+    first = 0
+    limit = min(len(old_lines), len(lines))
+
+    while first < limit and old_lines[first] == lines[first]:
+        first += 1
+
+    tail = 0
+    while tail < limit - first and old_lines[-tail - 1] == lines[-tail - 1]:
+        tail += 1
+
+    return first, len(lines) - tail
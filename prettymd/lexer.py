@@ -0,0 +1,120 @@
+"""分块扫描，一次找出文档中的代码块、表格、标题、引用和段落"""
+import re
+from collections import namedtuple
+
+# 行号范围为 [start, end)
+Block = namedtuple('Block', ['kind', 'start', 'end'])
+
+# 需要交给行格式化引擎处理的块
+PROSE_BLOCKS = ('paragraph', 'quote', 'header')
+
+# 需要单独判断的行，其余的行属于段落或所在的代码块、描述
+BLOCK_LINE = re.compile(r"""
+    ^(?:
+        (?P<fence>[^\S\n]*```[^\n]*)
+      | (?P<blank>[^\S\n]*)
+      | (?P<split>--[^|\n]*)
+      | (?P<header>\#+[^\S\n][^\n]*)
+      | (?P<pipe>[^\n]*\|[^\n]*)
+      | (?P<quote>>[^\n]*)
+    )$
+""", re.M | re.X)
+
+
+def lex_blocks(lines):
+    """将文档的行划分为连续的块，返回 Block 列表
+
+    kind 为以下之一：
+        code          代码块，包括首尾的 ```，相邻的代码块各为一块
+        blank         空行
+        desc          文档开头分割符之后的描述
+        split         分割符
+        table         表格
+        table_header  表格中以 # 开头的行，原样输出但仍计入标题
+        header        标题
+        quote         引用
+        paragraph     其他需要格式化的行
+    """
+    blocks = []
+    if not lines:
+        return blocks
+
+    text = '\n'.join(lines)
+    code = desc = table = False
+    # 当前块的类别和起始行，next_index 为下一个尚未划分的行
+    current, current_start = None, 0
+    next_index = 0
+    pos = 0
+
+    for match in BLOCK_LINE.finditer(text):
+        index = next_index + text.count('\n', pos, match.start()) - (next_index > 0)
+        pos = match.end()
+
+        if index > next_index:
+            # 中间的普通行
+            if code:
+                kind = 'code'
+            elif desc:
+                kind = 'desc'
+            else:
+                kind = 'paragraph'
+                table = False
+
+            if kind != current:
+                if current is not None:
+                    blocks.append(Block(current, current_start, next_index))
+                current, current_start = kind, next_index
+
+        kind = match.lastgroup
+
+        if kind == 'fence':
+            code = not code
+            kind = 'code'
+
+            if code and current == 'code':
+                # 相邻的代码块分开，每个代码块都从 ``` 开始
+                blocks.append(Block(current, current_start, index))
+                current_start = index
+        elif code:
+            kind = 'code'
+        elif kind == 'blank':
+            pass
+        elif desc:
+            kind = 'desc'
+        elif kind == 'split':
+            desc = not index
+        else:
+            line = match.group()
+            is_header = kind == 'header'
+
+            if kind == 'pipe' or is_header and '|' in line:
+                if not table and index + 1 < len(lines) and lines[index + 1][:1] == '-':
+                    table = True
+            else:
+                table = False
+
+            if is_header:
+                kind = 'table_header' if table else 'header'
+            elif table:
+                kind = 'table'
+            elif line[:1] == '>':
+                kind = 'quote'
+            else:
+                kind = 'paragraph'
+
+        if kind != current:
+            if current is not None:
+                blocks.append(Block(current, current_start, index))
+            current, current_start = kind, index
+
+        next_index = index + 1
+
+    if next_index < len(lines):
+        kind = 'code' if code else 'desc' if desc else 'paragraph'
+        if kind != current:
+            if current is not None:
+                blocks.append(Block(current, current_start, next_index))
+            current, current_start = kind, next_index
+
+    blocks.append(Block(current, current_start, len(lines)))
+    return blocks
@@ -0,0 +1,156 @@
+"""常驻进程，避免每次格式化都重新启动解释器、导入 prettymd 和建立缓存
+
+    $ python -m prettymd --serve                 # 监听 Unix socket，路径见 prettymd.client.default_socket_path
+    $ python -m prettymd --serve --socket -      # 通过标准输入输出通信
+
+每个请求和响应都是一行 JSON，options 为 format 的参数：
+
+    {"id": 1, "content": "中文abc", "options": {"style": "code"}}  ->  {"id": 1, "result": "中文 `abc`"}
+    {"id": 2, "path": "/docs/a.md", "options": {}}                 ->  {"id": 2, "changed": true}
+
+出错时返回 {"id": ..., "error": "..."}。
+"""
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+from .client import default_socket_path
+from .formatter import CompiledFormatter, split_final_newline, write_file
+
+# 由服务决定，不能通过请求指定的参数
+IGNORED_OPTIONS = ('output', 'stats')
+
+
+class FormatService(object):
+    """处理请求，为每组参数保留一个 CompiledFormatter，默认启用行缓存"""
+
+    def __init__(self, **defaults):
+        defaults.setdefault('line_cache', True)
+        self.defaults = {name: value for name, value in defaults.items() if name not in IGNORED_OPTIONS}
+        self.formatters = {}
+        self.lock = threading.Lock()
+
+    def get_formatter(self, options):
+        options = dict(self.defaults, **{name: value for name, value in options.items() if name not in IGNORED_OPTIONS})
+        key = json.dumps(options, sort_keys=True)
+
+        with self.lock:
+            formatter = self.formatters.get(key)
+            if formatter is None:
+                formatter = self.formatters[key] = CompiledFormatter(**options)
+
+        return formatter
+
+    def handle(self, request):
+        """处理一个请求，返回响应"""
+        response = {'id': request.get('id')}
+
+        try:
+            formatter = self.get_formatter(request.get('options') or {})
+
+            if 'path' in request:
+                response['changed'] = self.format_path(formatter, request['path'])
+            else:
+                response['result'] = formatter.format(request['content'])
+        except Exception as e:
+            response['error'] = '%s: %s' % (type(e).__name__, e)
+
+        return response
+
+    def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({'id': None, 'error': 'ValueError: %s' % e})
+
+        return json.dumps(self.handle(request), ensure_ascii=False)
+
+    def format_path(self, formatter, filepath):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        body, newline = split_final_newline(content)
+        new_content = formatter.format(body) + newline
+        if new_content == content:
+            return False
+
+        return write_file(filepath, new_content)
+
+
+def serve_stdio(service, stdin=None, stdout=None):
+    """从标准输入逐行读取请求，向标准输出写入响应，直到标准输入结束"""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        stdout.write(service.handle_line(line) + '\n')
+        stdout.flush()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.service.handle_line(line.decode('utf-8'))
+            self.wfile.write((response + '\n').encode('utf-8'))
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, socket_path, service):
+            self.service = service
+            super().__init__(socket_path, RequestHandler)
+
+
+def is_listening(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+def make_server(socket_path, service):
+    """在 socket_path 上创建服务，残留的 socket 文件会被删除"""
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError('unix socket is not supported, use --socket -')
+
+    if os.path.exists(socket_path):
+        if is_listening(socket_path):
+            raise ValueError('server is already running on %s' % socket_path)
+        os.unlink(socket_path)
+
+    return UnixServer(socket_path, service)
+
+
+def serve(socket_path=None, **defaults):
+    """启动服务，socket_path 为 '-' 时通过标准输入输出通信"""
+    service = FormatService(**defaults)
+
+    if socket_path == '-':
+        serve_stdio(service)
+        return
+
+    socket_path = socket_path or default_socket_path()
+    server = make_server(socket_path, service)
+    print('serving on %s' % socket_path, file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
@@ -0,0 +1,173 @@
+"""同时运行候选引擎和参考引擎，比较两者的输出和耗时
+
+新的行格式化引擎必须与 LineFormatter 的输出完全一致，切换之前可以在实际的文档和随机生成的内容上验证：
+
+    $ python -m prettymd.shadow docs/ -e run
+    $ python -m prettymd.shadow --fuzz 100000 -e run
+
+存在不一致时列出每一处所在的文件和行号，并以状态码 1 退出。
+"""
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from collections import namedtuple
+
+from .batch import find_files
+from .formatter import EN_CHARS, EN_MARKS, LAZY_LINE_ENGINES, LINE_ENGINES, SPACE_CHARS, ZH_MARKS, get_line_engine
+from .lexer import PROSE_BLOCKS, lex_blocks
+
+# 随机生成的行中的字符和片段
+FUZZ_CHARS = EN_CHARS + EN_MARKS + SPACE_CHARS + ZH_MARKS + '中文字符测试 \t　!?|>《》é'
+FUZZ_PIECES = ['[link](http://a.b)', '![img](x.png)', '`code`', 'https://a.b/c?d=1', '**', '# ', '> ', '1. ']
+
+# line_number 从 1 开始，随机生成的内容为生成的序号
+Divergence = namedtuple('Divergence', ['source', 'line_number', 'line', 'expected', 'actual'])
+
+
+def get_engine(engine):
+    if isinstance(engine, str):
+        return get_line_engine(engine)
+    return engine
+
+
+class ShadowReport(object):
+    """记录两个引擎的耗时和不一致的行"""
+
+    def __init__(self):
+        self.divergences = []
+        self.reference_time = 0.0
+        self.candidate_time = 0.0
+        self.lines = 0
+        self.sources = 0
+
+    @property
+    def speedup(self):
+        return self.reference_time / self.candidate_time if self.candidate_time else 0.0
+
+    def report(self):
+        rows = ['%s:%s: expected %r, got %r' % (d.source, d.line_number, d.expected, d.actual)
+                for d in self.divergences]
+        rows.append('%s divergences in %s lines from %s sources' % (len(self.divergences), self.lines, self.sources))
+        rows.append('reference %.4fs, candidate %.4fs, speedup %.2fx' % (
+            self.reference_time, self.candidate_time, self.speedup))
+        return '\n'.join(rows)
+
+
+def run_engine(engine, lines, code_quote):
+    """整批格式化，返回各行的结果和耗时；出错时逐行格式化，出错的行的结果为异常"""
+    start = time.perf_counter()
+    try:
+        results = engine.format_lines(lines, code_quote)
+    except Exception:
+        results = [run_line(engine, line, code_quote) for line in lines]
+    return results, time.perf_counter() - start
+
+
+def run_line(engine, line, code_quote):
+    try:
+        return engine(line, code_quote).format()
+    except Exception as e:
+        return e
+
+
+def compare_lines(lines, candidate, reference='char', style=None, source='<lines>', report=None):
+    """分别用两个引擎格式化所有的行，lines 为 (行号, 内容) 的可迭代对象"""
+    candidate = get_engine(candidate)
+    reference = get_engine(reference)
+    code_quote = '`' if style == 'code' else ''
+    report = report or ShadowReport()
+    report.sources += 1
+
+    numbered_lines = list(lines)
+    raw_lines = [line for _, line in numbered_lines]
+    expected_lines, reference_time = run_engine(reference, raw_lines, code_quote)
+    actual_lines, candidate_time = run_engine(candidate, raw_lines, code_quote)
+    report.reference_time += reference_time
+    report.candidate_time += candidate_time
+    report.lines += len(raw_lines)
+
+    for (line_number, line), expected, actual in zip(numbered_lines, expected_lines, actual_lines):
+        if isinstance(expected, Exception) or isinstance(actual, Exception):
+            same = type(expected) is type(actual)
+        else:
+            same = expected == actual
+
+        if not same:
+            report.divergences.append(Divergence(source, line_number, line, expected, actual))
+
+    return report
+
+
+def prose_lines(content):
+    """生成文档中需要行格式化引擎处理的行及其行号"""
+    lines = content.splitlines()
+    for kind, start, end in lex_blocks(lines):
+        if kind in PROSE_BLOCKS:
+            for index in range(start, end):
+                yield index + 1, lines[index]
+
+
+def shadow_document(content, candidate, reference='char', style=None, source='<string>', report=None):
+    return compare_lines(prose_lines(content), candidate, reference, style=style, source=source, report=report)
+
+
+def shadow_files(filepaths, candidate, reference='char', style=None, report=None):
+    report = report or ShadowReport()
+
+    for filepath in filepaths:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+        shadow_document(content, candidate, reference, style=style, source=filepath, report=report)
+
+    return report
+
+
+def fuzz_line(rand, size=30):
+    parts = []
+    for _ in range(rand.randint(0, size)):
+        if rand.random() < 0.1:
+            parts.append(rand.choice(FUZZ_PIECES))
+        else:
+            parts.append(rand.choice(FUZZ_CHARS))
+    return ''.join(parts)
+
+
+def shadow_fuzz(count, candidate, reference='char', style=None, seed=0, report=None):
+    """在随机生成的 count 行上比较两个引擎"""
+    rand = random.Random(seed)
+    lines = ((number, fuzz_line(rand)) for number in range(1, count + 1))
+    return compare_lines(lines, candidate, reference, style=style, source='<fuzz seed=%s>' % seed, report=report)
+
+
+def main():
+    parser = ArgumentParser(prog='python -m prettymd.shadow')
+    parser.add_argument('paths', metavar='PATH', nargs='*')
+    parser.add_argument('-e --engine', dest='engine', default='run')
+    parser.add_argument('--reference', dest='reference', default='char')
+    parser.add_argument('-s --style', dest='style', default=None)
+    parser.add_argument('--fuzz', dest='fuzz', type=int, default=0)
+    parser.add_argument('--seed', dest='seed', type=int, default=0)
+
+    args = parser.parse_args(args=sys.argv[1:])
+
+    for engine in (args.engine, args.reference):
+        if engine not in LINE_ENGINES and engine not in LAZY_LINE_ENGINES:
+            names = list(LINE_ENGINES) + list(LAZY_LINE_ENGINES)
+            parser.error('unknown engine %s, choose from %s' % (engine, ', '.join(names)))
+
+    if not args.paths and not args.fuzz:
+        parser.error('specify paths or --fuzz')
+
+    report = ShadowReport()
+    shadow_files(find_files(args.paths), args.engine, args.reference, style=args.style, report=report)
+
+    if args.fuzz:
+        shadow_fuzz(args.fuzz, args.engine, args.reference, style=args.style, seed=args.seed, report=report)
+
+    print(report.report())
+    sys.exit(1 if report.divergences else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""基于 numpy 的格式化引擎，适合批量处理大量文档
+
+    >>> format(content, engine='numpy')
+
+将一批行拼接后转换为码位数组，查表得到每个字符的类别和是否为空白，
+由相邻字符的比较得到需要添加空白的字符段的边界，并一次算出各字符段首尾之后的第一个非空白字符；
+之后只在字符段的首尾执行 process，输出与 LineFormatter 一致。
+
+只有 format_lines 的整批内容超过 MIN_BATCH_SIZE 个字符时才使用 numpy，
+逐行格式化（format_stream、is_formatted、行缓存等）和没有安装 numpy 时与 RunLineFormatter 相同。
+"""
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .formatter import CHAR_FLAGS, PROTECTED_SPAN, REQUIRE_SPACE, RunLineFormatter
+
+# 所有的空白字符都不大于 U+3000；大于 U+FFFF 的码位按 U+FFFF 查表，
+# 它们都不是空白字符，也都不需要添加空白
+MAX_SPACE = 0x3000
+TABLE_SIZE = 0x10000
+
+# 少于这么多字符的一批内容直接逐行处理，准备数组的开销比节省的时间多
+MIN_BATCH_SIZE = 4096
+
+FLAG_TABLE = None
+SPACE_TABLE = None
+
+
+def build_tables():
+    global FLAG_TABLE, SPACE_TABLE
+
+    if FLAG_TABLE is None:
+        flags = np.zeros(TABLE_SIZE, dtype=np.uint8)
+        flags[[ord(char) for char in CHAR_FLAGS]] = list(CHAR_FLAGS.values())
+
+        spaces = np.zeros(TABLE_SIZE, dtype=bool)
+        spaces[[code for code in range(MAX_SPACE + 1) if chr(code).isspace()]] = True
+
+        FLAG_TABLE, SPACE_TABLE = flags, spaces
+
+    return FLAG_TABLE, SPACE_TABLE
+
+
+class LineIndex(object):
+    """一批行中所有字符段的起止位置及其首尾之后的第一个非空白字符，位置均为所在行中的索引
+
+    第 i 行的字符段为 bounds[i] 到 bounds[i + 1] 之间的部分。
+    """
+
+    def __init__(self, lines, spans):
+        flag_table, space_table = build_tables()
+
+        lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+        offsets = np.zeros(len(lines), dtype=np.int64)
+        np.cumsum(lengths[:-1] + 1, out=offsets[1:])
+
+        text = '\n'.join(lines)
+        codes = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        codes = np.minimum(codes, TABLE_SIZE - 1)
+        size = len(codes)
+
+        # 需要添加空白的字符，受保护的内容不参与
+        active = (flag_table[codes] & REQUIRE_SPACE) != 0
+        for offset, line_spans in zip(offsets.tolist(), spans):
+            for start, end, _ in line_spans:
+                active[offset + start:offset + end] = False
+
+        edges = np.diff(active.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1)
+
+        # 每个位置及其之后第一个非空白字符的位置，末尾多一个哨兵
+        positions = np.where(space_table[codes], size, np.arange(size))
+        non_blanks = np.append(np.minimum.accumulate(positions[::-1])[::-1], size)
+
+        # 换算为所在行中的索引，超出行尾时为行的长度
+        run_lines = np.searchsorted(offsets, run_starts, side='right') - 1
+        run_offsets = offsets[run_lines]
+        run_lengths = lengths[run_lines]
+
+        self.starts = (run_starts - run_offsets).tolist()
+        self.ends = (run_ends - run_offsets).tolist()
+        self.next_starts = np.minimum(non_blanks[run_starts + 1] - run_offsets, run_lengths).tolist()
+        self.next_ends = np.minimum(non_blanks[run_ends] - run_offsets, run_lengths).tolist()
+        self.bounds = np.searchsorted(run_starts, offsets).tolist() + [len(run_starts)]
+        self.first_words = np.minimum(non_blanks[offsets] - offsets, lengths).tolist()
+
+
+class NumpyLineFormatter(RunLineFormatter):
+    """批量计算字符段边界的格式化引擎，通过 format_lines 一次处理多行，逐行处理时与 RunLineFormatter 相同"""
+    __slots__ = ('line_index', 'run_index', 'run_stop', 'run_start', 'run_end', 'next_start', 'next_end')
+
+    def reset(self, line):
+        super().reset(line)
+        self.line_index = None
+        # 字符段首尾之后的位置不会是负数，不会与 find_non_blank 的参数相同
+        self.run_start = self.run_end = -2
+        self.next_start = self.next_end = None
+
+    @classmethod
+    def format_lines(cls, lines, code_quote, stats=None):
+        if sum(map(len, lines)) < MIN_BATCH_SIZE:
+            return super().format_lines(lines, code_quote, stats)
+
+        spans = find_batch_spans(lines, stats)
+        line_index = LineIndex(lines, spans)
+        formatter = cls('', code_quote, stats)
+        new_lines = []
+
+        for index, line in enumerate(lines):
+            formatter.reset(line)
+            formatter.load(line_index, index, spans[index])
+            new_lines.append(formatter.format())
+
+        return new_lines
+
+    def load(self, line_index, index, spans):
+        """使用 LineIndex 中第 index 行的结果"""
+        self.line_index = line_index
+        self.run_index = line_index.bounds[index]
+        self.run_stop = line_index.bounds[index + 1]
+        self.first_word_index = line_index.first_words[index]
+
+        for start, end, opaque in spans:
+            self.add_span(start, end, opaque)
+
+    def find_spans(self):
+        if self.line_index is None:
+            super().find_spans()
+
+    def index_blanks(self):
+        if self.line_index is None:
+            super().index_blanks()
+        else:
+            # first_word_index 已经在 load 中设置
+            self.prev_index = -1
+
+    def find_non_blank(self, index):
+        # 字符段首尾之后的位置已经算出，其余位置（行内代码和网址的尾字符之后）按正则查找
+        if index == self.run_end:
+            return self.next_end
+        if index == self.run_start + 1:
+            return self.next_start
+        return super().find_non_blank(index)
+
+    def iter_runs(self, start, end):
+        line_index = self.line_index
+        if line_index is None:
+            yield from super().iter_runs(start, end)
+            return
+
+        # 字符段不会跨越受保护的内容，按顺序依次取出即可
+        starts = line_index.starts
+        while self.run_index < self.run_stop and starts[self.run_index] < end:
+            run_index = self.run_index
+            self.run_index += 1
+            self.run_start = starts[run_index]
+            self.run_end = line_index.ends[run_index]
+            self.next_start = line_index.next_starts[run_index]
+            self.next_end = line_index.next_ends[run_index]
+            yield self.run_start, self.run_end
+
+
+def find_batch_spans(lines, stats=None):
+    """查找每一行中不需要格式化的内容，没有 [、` 和 :// 的行不会包含这些内容，不必执行正则"""
+    start_time = time.perf_counter()
+    spans = [[(match.start(), match.end(), match.lastgroup == 'link') for match in PROTECTED_SPAN.finditer(line)]
+             if '[' in line or '`' in line or '://' in line else []
+             for line in lines]
+
+    if stats is not None:
+        stats.add_time('spans', time.perf_counter() - start_time)
+    return spans
+
+
+# 没有安装 numpy 时使用纯 Python 的引擎
+LineEngine = NumpyLineFormatter if np is not None else RunLineFormatter
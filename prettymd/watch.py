@@ -0,0 +1,256 @@
+"""监视目录，markdown 文件保存后自动格式化
+
+    $ python -m prettymd --watch docs/ -s code
+
+Linux 上通过 inotify 接收文件变化的通知，其他平台定时扫描目录。
+连续多次保存只在停止变化 debounce 秒后格式化一次，只处理发生变化的文件；
+格式化后写回的内容会被记录下来，再次收到这个文件的通知时内容相同则跳过，不会反复触发。
+"""
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import struct
+import sys
+import time
+
+from .batch import MARKDOWN_SUFFIXES, find_dir_files
+from .formatter import CompiledFormatter, split_final_newline, write_file
+
+DEBOUNCE = 0.2
+POLL_INTERVAL = 0.5
+
+# inotify 的事件，见 inotify(7)
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_markdown(path):
+    return path.endswith(MARKDOWN_SUFFIXES)
+
+
+def walk_dirs(root):
+    """生成 root 及其中所有不以 . 开头的目录，与 find_dir_files 查找的范围相同"""
+    for dirpath, dirs, _ in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        yield dirpath
+
+
+class PollingWatcher(object):
+    """定时扫描目录，比较各文件的修改时间和大小"""
+
+    def __init__(self, root, interval=POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.files = self.scan()
+
+    def scan(self):
+        files = {}
+        for path in find_dir_files(self.root):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def read(self, timeout=None):
+        """返回发生变化的文件，最多等待 timeout 秒，为 None 时一直等到有文件变化"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            delay = self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(delay)
+
+            files = self.scan()
+            changed = {path for path, stat in files.items() if self.files.get(path) != stat}
+            self.files = files
+
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """通过 inotify 接收文件写入和移入的通知，新建的目录会自动加入监视"""
+
+    def __init__(self, root):
+        self.libc = load_libc()
+        if self.libc is None:
+            raise OSError('inotify is not available')
+
+        self.root = root
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.dirs = {}
+        for dirpath in walk_dirs(root):
+            self.add_dir(dirpath)
+
+    def add_dir(self, dirpath):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = dirpath
+
+    def read(self, timeout=None):
+        """返回发生变化的文件，最多等待 timeout 秒，为 None 时一直等到有文件变化"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            changed = self.read_events() if ready else set()
+
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        pos = 0
+
+        while pos < len(data):
+            wd, mask, _, size = EVENT_HEADER.unpack_from(data, pos)
+            name = os.fsdecode(data[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + size].rstrip(b'\0'))
+            pos += EVENT_HEADER.size + size
+
+            if mask & IN_Q_OVERFLOW:
+                # 丢失了部分通知，只能重新查找所有文件
+                changed.update(find_dir_files(self.root))
+                continue
+
+            dirpath = self.dirs.get(wd)
+            if dirpath is None or not name:
+                continue
+
+            path = os.path.join(dirpath, name)
+
+            if mask & IN_ISDIR:
+                if not name.startswith('.'):
+                    # 加入监视之前目录中可能已经有文件
+                    for new_dir in walk_dirs(path):
+                        self.add_dir(new_dir)
+                    changed.update(find_dir_files(path))
+
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and is_markdown(name):
+                changed.add(path)
+
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return None
+
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+
+    return libc
+
+
+def make_watcher(root, polling=False):
+    """可以使用 inotify 时使用 InotifyWatcher，否则定时扫描"""
+    if not polling:
+        try:
+            return InotifyWatcher(root)
+        except OSError:
+            pass
+
+    return PollingWatcher(root)
+
+
+def iter_changes(watcher, debounce=DEBOUNCE):
+    """生成每一批发生变化的文件，一批变化在 debounce 秒内没有新的变化时结束"""
+    while True:
+        changed = watcher.read()
+
+        while True:
+            more = watcher.read(debounce)
+            if not more:
+                break
+            changed |= more
+
+        yield sorted(changed)
+
+
+def digest(content):
+    return hashlib.sha1(content.encode('utf-8', 'surrogatepass')).digest()
+
+
+def format_changed(formatter, paths, known):
+    """格式化发生变化的文件，返回写入的文件
+
+    known 记录每个文件最近一次格式化的结果，内容与之相同的文件是自己写入的或者已经格式化，直接跳过。
+    """
+    written = []
+
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            known.pop(path, None)
+            continue
+        except (OSError, ValueError) as e:
+            print('failed to read %s: %s' % (path, e), file=sys.stderr)
+            continue
+
+        if known.get(path) == digest(content):
+            continue
+
+        body, newline = split_final_newline(content)
+        new_content = formatter.format(body) + newline
+        if new_content != content and write_file(path, new_content):
+            written.append(path)
+
+        known[path] = digest(new_content)
+
+    return written
+
+
+def watch(root, debounce=DEBOUNCE, polling=False, **kwargs):
+    """监视 root 中的 markdown 文件，直到按下 Ctrl-C"""
+    if not os.path.isdir(root):
+        raise ValueError('%s is not a directory' % root)
+
+    kwargs['line_cache'] = True
+    formatter = CompiledFormatter(**kwargs)
+    watcher = make_watcher(root, polling=polling)
+    known = {}
+
+    print('watching %s' % root, file=sys.stderr)
+
+    try:
+        for paths in iter_changes(watcher, debounce):
+            for path in format_changed(formatter, paths, known):
+                print('formatted %s' % path, flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
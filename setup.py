@@ -33,6 +33,9 @@ setup(
     ],
     description="A tool that formats markdown text in Chinese.",
     install_requires=requirements,
+    extras_require={
+        'numpy': ['numpy'],
+    },
     long_description=readme,
     long_description_content_type='text/markdown',
     include_package_data=True,
@@ -0,0 +1,36 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from prettymd.aio import aformat, aformat_file
+
+
+class TestAio(TestCase):
+
+    def test_aformat(self):
+        self.assertEqual('中文 `nihao`', asyncio.run(aformat('中文nihao', style='code')))
+
+    def test_aformat_with_process_executor_and_semaphore(self):
+        texts = ['中文text%s' % i for i in range(20)]
+
+        async def main():
+            semaphore = asyncio.Semaphore(2)
+            with ProcessPoolExecutor(2) as executor:
+                return await asyncio.gather(*(aformat(text, executor, semaphore) for text in texts))
+
+        self.assertEqual(['中文 text%s' % i for i in range(20)], asyncio.run(main()))
+
+    def test_aformat_file(self):
+        with TemporaryDirectory() as tmpdir:
+            filepath = os.path.join(tmpdir, 'a.md')
+            output = os.path.join(tmpdir, 'b.md')
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write('中文nihao')
+
+            self.assertEqual('中文 nihao', asyncio.run(aformat_file(filepath, output=None)))
+            asyncio.run(aformat_file(filepath, output=output))
+
+            with open(output, encoding='utf-8') as f:
+                self.assertEqual('中文 nihao', f.read())
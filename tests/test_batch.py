@@ -0,0 +1,133 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from prettymd.batch import check_files, find_files, format_files, format_many
+from prettymd.cache import ResultCache
+from prettymd.formatter import FormatStats, format
+
+
+class TestBatch(TestCase):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.root = self.tmpdir.name
+        self.files = {
+            'a.md': '中文nihao',
+            'sub/b.md': '已经 formatted 的内容',
+            'sub/deep/c.markdown': '再来一个test',
+            'sub/d.txt': '不是markdown',
+        }
+
+        for name, content in self.files.items():
+            self.write(name, content)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def write(self, name, content):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(self.path(name), encoding='utf-8') as f:
+            return f.read()
+
+    def test_find_files_in_dir(self):
+        expect = [self.path('a.md'), self.path('sub/b.md'), self.path('sub/deep/c.markdown')]
+        self.assertEqual(expect, find_files([self.root]))
+
+    def test_find_files_by_pattern(self):
+        expect = [self.path('sub/b.md')]
+        self.assertEqual(expect, find_files([os.path.join(self.root, '**', 'b.md')]))
+
+    def test_format_files_in_place(self):
+        for jobs in (1, 2):
+            changed = format_files(find_files([self.root]), jobs=jobs)
+
+            if jobs == 1:
+                self.assertEqual([self.path('a.md'), self.path('sub/deep/c.markdown')], changed)
+            else:
+                self.assertEqual([], changed)
+
+            self.assertEqual('中文 nihao', self.read('a.md'))
+            self.assertEqual('再来一个 test', self.read('sub/deep/c.markdown'))
+            self.assertEqual('不是markdown', self.read('sub/d.txt'))
+
+    def test_check_files(self):
+        filepaths = find_files([self.root])
+        expect = [self.path('a.md'), self.path('sub/deep/c.markdown')]
+
+        for jobs in (1, 2):
+            self.assertEqual(expect, check_files(filepaths, jobs=jobs))
+
+        self.assertEqual('中文nihao', self.read('a.md'))
+        format_files(filepaths)
+        self.assertEqual([], check_files(filepaths))
+
+    def test_final_newline_kept(self):
+        filepaths = [self.path('e.md'), self.path('f.md')]
+
+        for cache in (None, ResultCache(os.path.join(self.root, '.cache'))):
+            self.write('e.md', '已经 formatted 的内容\n')
+            self.write('f.md', '中文nihao\n\n')
+
+            self.assertEqual([self.path('f.md')], check_files(filepaths, cache=cache))
+            self.assertEqual([self.path('f.md')], format_files(filepaths, cache=cache))
+            self.assertEqual('已经 formatted 的内容\n', self.read('e.md'))
+            self.assertEqual('中文 nihao\n', self.read('f.md'))
+
+            # 已经格式化的文件不会再被检查出来或写入
+            self.assertEqual([], check_files(filepaths, cache=cache))
+            self.assertEqual([], format_files(filepaths, cache=cache))
+
+    def test_format_files_with_stats(self):
+        for jobs in (1, 2):
+            stats = FormatStats()
+            format_files(find_files([self.root]), jobs=jobs, stats=stats)
+            self.assertEqual(3, stats.counters['documents'])
+            self.assertEqual(3, stats.lines['paragraph'])
+
+
+class TestFormatMany(TestCase):
+
+    def setUp(self):
+        self.contents = ['中文%sabc' % index for index in range(20)] + ['# 标题title', '']
+
+    def test_ordered(self):
+        expect = [format(content, style='code') for content in self.contents]
+
+        for pool in ('process', 'thread'):
+            for workers, chunksize in ((1, 1), (2, 1), (3, 4)):
+                results = format_many(iter(self.contents), workers=workers, chunksize=chunksize, pool=pool,
+                                      style='code')
+                self.assertEqual(expect, list(results))
+
+    def test_unordered(self):
+        results = format_many(self.contents, workers=2, chunksize=3, ordered=False, pool='thread')
+        self.assertEqual(list(enumerate(map(format, self.contents))), sorted(results))
+
+    def test_bounded_pending(self):
+        consumed = []
+
+        def contents():
+            for index in range(1000):
+                consumed.append(index)
+                yield '中文abc'
+
+        results = format_many(contents(), workers=2, chunksize=5, pool='thread')
+        self.assertEqual('中文 abc', next(results))
+        # 每个 worker 最多排队两个分片
+        self.assertLessEqual(len(consumed), 2 * 2 * 5 + 5)
+        results.close()
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            format_many([], engine='unknown')
+
+        with self.assertRaises(ValueError):
+            format_many([], pool='unknown')
@@ -0,0 +1,78 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from prettymd.cache import ResultCache
+from prettymd.formatter import format_file
+
+
+class TestResultCache(TestCase):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.tmpdir.name, 'cache'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def entries(self):
+        return sorted(os.listdir(self.cache.path))
+
+    def test_cached_result_skips_formatting(self):
+        self.assertEqual('中文 `nihao`', self.cache.format('中文nihao', style='code'))
+        self.assertEqual('中文 nihao', self.cache.format('中文 nihao'))
+
+        with patch('prettymd.cache.format') as format:
+            self.assertEqual('中文 `nihao`', self.cache.format('中文nihao', style='code'))
+            self.assertEqual('中文 nihao', self.cache.format('中文 nihao', style=None))
+            format.assert_not_called()
+
+    def test_is_formatted(self):
+        self.assertFalse(self.cache.is_formatted('中文nihao'))
+        self.assertTrue(self.cache.is_formatted('中文 nihao'))
+        self.assertEqual(1, len(self.entries()))
+
+        with patch('prettymd.cache.is_formatted') as is_formatted:
+            self.assertTrue(self.cache.is_formatted('中文 nihao'))
+            is_formatted.assert_not_called()
+
+        self.cache.format('中文nihao')
+        with patch('prettymd.cache.is_formatted') as is_formatted:
+            self.assertFalse(self.cache.is_formatted('中文nihao'))
+            is_formatted.assert_not_called()
+
+    def test_key_depends_on_options(self):
+        self.assertEqual(self.cache.key('text', {}), self.cache.key('text', {'style': None, 'output': 'x'}))
+        self.assertNotEqual(self.cache.key('text', {}), self.cache.key('text', {'style': 'code'}))
+        self.assertNotEqual(self.cache.key('text', {}), self.cache.key('text2', {}))
+
+    def test_format_file_with_cache(self):
+        filepath = os.path.join(self.tmpdir.name, 'a.md')
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write('中文nihao')
+
+        for _ in range(2):
+            self.assertEqual('中文 nihao', format_file(filepath, cache=self.cache, output=None))
+        self.assertEqual(1, len(self.entries()))
+
+    def test_evict_by_age(self):
+        self.cache.format('old')
+        self.cache.format('new')
+        old_path = os.path.join(self.cache.path, self.cache.key('old', {}))
+        past = time.time() - self.cache.max_age - 10
+        os.utime(old_path, (past, past))
+
+        self.cache.evict()
+        self.assertEqual([self.cache.key('new', {})], self.entries())
+
+    def test_evict_by_size(self):
+        for index, content in enumerate(('中文a', '中文b', '中文c')):
+            self.cache.format(content)
+            path = os.path.join(self.cache.path, self.cache.key(content, {}))
+            os.utime(path, (time.time() - 10 + index, time.time() - 10 + index))
+
+        self.cache.max_size = len('>中文 c'.encode('utf-8'))
+        self.cache.evict()
+        self.assertEqual([self.cache.key('中文c', {})], self.entries())
@@ -1,7 +1,15 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
 from textwrap import dedent
 from unittest import TestCase
+from unittest.mock import patch
 
-from prettymd.formatter import format
+from prettymd.formatter import (LINE_CACHE, CompiledFormatter, FormatStats, Formatter, LineFormatter, format,
+                                format_file, format_stream, get_line_engine, is_formatted, write_file)
+from prettymd.shadow import shadow_fuzz
 
 
 class TestFormatter(TestCase):
@@ -24,6 +32,46 @@ class TestFormatter(TestCase):
 
         self.assert_formatted(text, text)
 
+    def test_py_prompt_only_in_python_blocks(self):
+        text = dedent("""
+        ```shell
+        In [1]: ls
+           ...: pwd
+        ```
+        ```python
+        In [1]: x = 1
+           ...: y = 2
+        Out[1]: 1
+        ```
+          ```{pycon} title="a"
+        Out[2]:    ...: 3
+          ```
+        ```
+        In [1]: x
+        ```
+        """).strip()
+        expect = dedent("""
+        ```shell
+        In [1]: ls
+           ...: pwd
+        ```
+        ```python
+        >>> x = 1
+        ... y = 2
+        1
+        ```
+          ```{pycon} title="a"
+        ... 3
+          ```
+        ```
+        In [1]: x
+        ```
+        """).strip()
+
+        self.assert_formatted(text, expect)
+        self.assert_formatted(text, text, py_prompt='ipython')
+        self.assertEqual(expect, '\n'.join(format_stream(iter(text.splitlines()))))
+
     def test_quote_en_words(self):
         text = '摘要算法就是通过摘要函数f()对任意长度的数据data计算出固定长度的摘要digest，目的是为了发现原始数据是否被人篡改过。'
         expect = '摘要算法就是通过摘要函数 `f()` 对任意长度的数据 `data` 计算出固定长度的摘要 `digest`，目的是为了发现原始数据是否被人篡改过。'
@@ -177,3 +225,287 @@ class TestFormatter(TestCase):
         tags: [django]
         ---"""
         self.assert_formatted(dedent(text), dedent(text).strip())
+
+    def test_inline_code_not_formatted(self):
+        text = '使用`中文abc`命令'
+        expect = '使用 `中文abc` 命令'
+        self.assert_formatted(text, expect)
+
+    def test_bare_url_not_separate(self):
+        text = '访问https://example.com/a?b=1获取数据'
+        expect = '访问 `https://example.com/a?b=1` 获取数据'
+        self.assert_formatted(text, expect)
+
+    def test_link_like_text_kept(self):
+        text = '文本 <LinkStashed(num=0)> [a](b)中文'
+        self.assert_formatted(text, text)
+
+    def test_char_flags_match_predicates(self):
+        formatter = LineFormatter('', '`')
+
+        for char in map(chr, range(0x10000)):
+            is_en = bool(re.match(r'[a-zA-Z0-9_\\\[\]\{\}\*\'&#\$\(\)]', char))
+            is_en_mark = char in ("'", '"', ':', ';', '(', ')', '/')
+            is_zh_mark = char in '，。（）：、'
+            self.assertEqual(is_en, bool(formatter.is_en(char)), char)
+            self.assertEqual(is_en_mark, bool(formatter.is_en_mark(char)), char)
+            self.assertEqual(is_zh_mark, bool(formatter.is_zh_mark(char)), char)
+            self.assertEqual('\u4e00' <= char <= '\u9fa5' or is_zh_mark, bool(formatter.is_zh(char)), char)
+            self.assertEqual(is_en or is_en_mark or char in '-`=.,', bool(formatter.require_space(char)), char)
+
+    def test_long_line_formatted_in_linear_time(self):
+        sentence = '默认的表名是appName modelName，通过函数f()计算data的摘要。 '
+        repeat = 1024 * 1024 // len(sentence.encode('utf-8')) + 1
+        text = sentence * repeat
+        expect = '默认的表名是 `appName modelName`，通过函数 `f()` 计算 `data` 的摘要。 ' * repeat
+
+        start = time.perf_counter()
+        self.assert_formatted(text, expect)
+        self.assertLess(time.perf_counter() - start, 30)
+
+    def test_unmatched_brackets_in_linear_time(self):
+        # 类似压缩的 json 或日志，大量的 [ 没有配对的 ](
+        for sentence, expect in (('中文[1,2], ', '中文 `[1,2],` '), ('[a](x中文 ', '`[a](x` 中文 ')):
+            repeat = 1024 * 1024 // len(sentence.encode('utf-8')) + 1
+
+            start = time.perf_counter()
+            self.assert_formatted(sentence * repeat, expect * repeat)
+            self.assertLess(time.perf_counter() - start, 30)
+
+    def test_line_cache(self):
+        LINE_CACHE.clear()
+        text = '中文nihao\n中文nihao\n英文english'
+        expect = '中文 `nihao`\n中文 `nihao`\n英文 `english`'
+
+        self.assert_formatted(text, expect, line_cache=True)
+        self.assertEqual(dict(hits=1, misses=2, size=2, maxsize=LINE_CACHE.maxsize), LINE_CACHE.info())
+
+        self.assert_formatted(text, expect, line_cache=True)
+        self.assertEqual(4, LINE_CACHE.hits)
+
+        self.assert_formatted(text, text.replace('nihao', ' nihao').replace('english', ' english'), line_cache=True, style=None)
+        self.assertEqual(4, LINE_CACHE.misses)
+        LINE_CACHE.clear()
+
+    def test_stats(self):
+        text = dedent("""
+        # 标题
+        中文english
+        > 引用quote
+
+        ```
+        In [1]: x
+        ```
+        """).strip()
+        stats = FormatStats()
+        self.assert_formatted(text, format(text, style='code'), stats=stats)
+        self.assert_formatted(text, format(text, style='code'), stats=stats)
+
+        self.assertEqual(dict(header=2, paragraph=2, quote=2, blank=2, code=6), dict(stats.lines))
+        self.assertEqual(2, stats.counters['documents'])
+        self.assertEqual(2 * len(text.replace('\n', '')), stats.counters['chars'])
+
+        times = stats.as_dict()['times']
+        self.assertGreater(times['total'], 0)
+        self.assertGreaterEqual(times['total'], times['line_engine'] + times['py_prompt'] + times['headers'])
+        self.assertGreaterEqual(times['line_engine'], times['spans'])
+        self.assertIn('time total', stats.report())
+
+    def test_stream_stats(self):
+        text = '# 标题\n中文english\n> 引用quote\n'
+        for check in (False, True):
+            stats = FormatStats()
+            if check:
+                is_formatted(text, style='code', stats=stats)
+            else:
+                list(format_stream(text.splitlines(), style='code', stats=stats))
+
+            times = stats.as_dict()['times']
+            self.assertEqual(1, stats.counters['documents'])
+            self.assertGreater(times['line_engine'], 0)
+            self.assertGreaterEqual(times['total'], times['line_engine'] + times['headers'])
+
+
+class TestRunEngine(TestFormatter):
+
+    def assert_formatted(self, text, expect, **kwargs):
+        kwargs.setdefault('engine', 'run')
+        super().assert_formatted(text, expect, **kwargs)
+
+
+class TestNumpyEngine(TestFormatter):
+    """没有安装 numpy 时使用 RunLineFormatter"""
+
+    def assert_formatted(self, text, expect, **kwargs):
+        kwargs.setdefault('engine', 'numpy')
+        super().assert_formatted(text, expect, **kwargs)
+
+    def test_same_as_char_engine(self):
+        report = shadow_fuzz(3000, 'numpy', style='code')
+        self.assertEqual([], report.divergences)
+
+    def test_batch_boundaries(self):
+        engine = get_line_engine('numpy')
+        lines = ['', 'abc', '中文abc `code`中文', '   ', 'x', '[link](http://a.b)中文abc', '中文\U0001f600abc']
+        # 行数较少时逐行格式化，较多时整批计算字符段边界
+        for batch in (lines, lines * 300):
+            self.assertEqual([LineFormatter(line, '`').format() for line in batch], engine.format_lines(batch, '`'))
+        self.assertEqual([], engine.format_lines([], '`'))
+
+
+class TestLineFormatterReuse(TestCase):
+
+    def test_reset(self):
+        lines = ['中文abc `code`中文', '', 'a**b**中文', '[link](http://a.b)中文abc', '  中文 abc  ', 'x' * 100, 'y']
+        for name in ('char', 'run', 'numpy'):
+            formatter = get_line_engine(name)('', '`')
+            self.assertFalse(hasattr(formatter, '__dict__'))
+
+            for line in lines:
+                formatter.reset(line)
+                self.assertEqual(LineFormatter(line, '`').format(), formatter.format())
+
+    def test_one_engine_per_document(self):
+        formatter = Formatter(iter(['中文abc', 'abc中文', '中文']), style='code')
+        formatter.format()
+        first_engine = formatter.line_formatter
+        self.assertEqual('中文 `abc`', formatter.format_line('中文abc'))
+        self.assertIs(first_engine, formatter.line_formatter)
+
+
+class TestFormatStream(TestCase):
+
+    def test_same_as_format(self):
+        text = dedent("""
+        ## h2
+        你好nihao
+        > quote
+
+        ### h3
+        ```python
+        In [1]: print(1)
+        ```
+        ## h22
+        """)
+
+        for kwargs in ({'style': 'code'}, {'newline_between_headers': True}, {'reindex_headers': False}):
+            self.assertEqual(format(text, **kwargs), '\n'.join(format_stream(text, **kwargs)))
+            self.assertEqual(format(text, **kwargs), '\n'.join(format_stream(text.splitlines(True), **kwargs)))
+
+    def test_lines_yielded_before_input_exhausted(self):
+        consumed = []
+
+        def lines():
+            for line in ('第一行line', '第二行line'):
+                consumed.append(line)
+                yield line
+
+        stream = format_stream(lines(), reindex_headers=False)
+        self.assertEqual('第一行 line', next(stream))
+        self.assertEqual(['第一行line', '第二行line'], consumed)
+        self.assertEqual(['第二行 line'], list(stream))
+
+
+class TestIsFormatted(TestCase):
+
+    def test_same_as_format(self):
+        text = dedent("""
+        ## h2
+        你好nihao
+        > quote
+
+        ### h3
+        ```python
+        In [1]: print(1)
+        ```
+        ## h22
+        """).strip()
+
+        for kwargs in ({'style': 'code'}, {'newline_between_headers': True}, {'reindex_headers': False}):
+            formatted = format(text, **kwargs)
+            self.assertFalse(is_formatted(text, **kwargs))
+            self.assertFalse(is_formatted(formatted + '\n', **kwargs))
+
+            for content in (formatted, formatted.replace('1.', '3.')):
+                self.assertEqual(format(content, **kwargs) == content, is_formatted(content, **kwargs))
+
+        self.assertTrue(is_formatted('你好 `nihao`\n> quote\n\n', style='code'))
+
+    def test_stops_at_first_difference(self):
+        lines = ['中文nihao'] + ['中文 nihao'] * 100
+        self.assertTrue(is_formatted('\n'.join(lines[1:])))
+
+        with patch.object(LineFormatter, 'format', autospec=True, side_effect=LineFormatter.format) as line_format:
+            self.assertFalse(is_formatted('\n'.join(lines)))
+
+        self.assertEqual(1, line_format.call_count)
+
+
+class TestWriteFile(TestCase):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'a.md')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_skip_unchanged(self):
+        self.assertTrue(format('中文nihao', output=self.path))
+        os.chmod(self.path, 0o640)
+        os.utime(self.path, (0, 0))
+
+        self.assertFalse(format('中文 nihao', output=self.path))
+        self.assertEqual(0, os.stat(self.path).st_mtime)
+
+        with patch('os.replace') as replace:
+            self.assertFalse(write_file(self.path, '中文 nihao'))
+            replace.assert_not_called()
+
+        self.assertTrue(write_file(self.path, '中文 nihao2'))
+        self.assertEqual(0o640, os.stat(self.path).st_mode & 0o777)
+        self.assertEqual(['a.md'], os.listdir(self.tmpdir.name))
+
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual('中文 nihao2', f.read())
+
+    def test_failed_write_keeps_original(self):
+        write_file(self.path, '原内容')
+
+        with patch('os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                write_file(self.path, '新内容')
+
+        self.assertEqual(['a.md'], os.listdir(self.tmpdir.name))
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual('原内容', f.read())
+
+    def test_format_file_by_blocks(self):
+        write_file(self.path, '中文nihao\n\n```\ncode中文\n```\n')
+
+        with patch.object(Formatter, 'process_blocks', autospec=True,
+                          side_effect=Formatter.process_blocks) as process_blocks:
+            self.assertEqual('中文 `nihao`\n```\ncode中文\n```', format_file(self.path, output=None, style='code'))
+            process_blocks.assert_called_once()
+
+
+class TestCompiledFormatter(TestCase):
+
+    def test_reusable(self):
+        formatter = CompiledFormatter(style='code')
+        self.assertEqual('中文 `nihao`', formatter.format('中文nihao'))
+        self.assertEqual('## 1. 标题 `title`', formatter.format('## 标题title'))
+        self.assertEqual(['中文 `nihao`'], list(formatter.format_stream(['中文nihao'])))
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            CompiledFormatter(py_prompt='unknown')
+
+    def test_concurrent_format(self):
+        formatter = CompiledFormatter(style='code', line_cache=True)
+        texts = ['## 标题%s\n中文text%s\n### 子标题' % (i, i) for i in range(200)]
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(formatter.format, texts))
+
+        self.assertEqual([format(text, style='code') for text in texts], results)
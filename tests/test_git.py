@@ -0,0 +1,90 @@
+import os
+import shutil
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+
+from prettymd.git import changed_files
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@skipUnless(shutil.which('git'), 'git is not installed')
+class TestChangedFiles(TestCase):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.root = self.tmpdir.name
+        self.git('init', '-q')
+        self.write('a.md', '中文 abc')
+        self.write('docs/b.md', '中文 abc')
+        self.write('c.txt', '中文abc')
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', 'init')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def git(self, *args):
+        env = dict(os.environ, GIT_AUTHOR_NAME='a', GIT_AUTHOR_EMAIL='a@b.c',
+                   GIT_COMMITTER_NAME='a', GIT_COMMITTER_EMAIL='a@b.c')
+        subprocess.run(['git'] + list(args), cwd=self.root, env=env, check=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.root, name), encoding='utf-8') as f:
+            return f.read()
+
+    def test_changed_files(self):
+        self.assertEqual([], changed_files(cwd=self.root))
+
+        self.write('docs/b.md', '中文abc')
+        self.write('c.txt', '中文abcd')
+        self.write('new.md', '未跟踪的文件')
+        self.assertEqual([os.path.join('docs', 'b.md')], changed_files(cwd=self.root))
+        self.assertEqual(['b.md'], changed_files(cwd=os.path.join(self.root, 'docs')))
+        self.assertEqual([], changed_files(staged=True, cwd=self.root))
+
+        self.git('add', 'docs/b.md', 'new.md')
+        self.git('rm', '-q', 'a.md')
+        self.assertEqual([os.path.join('docs', 'b.md'), 'new.md'], changed_files(staged=True, cwd=self.root))
+
+        self.git('commit', '-q', '-m', 'change')
+        self.assertEqual([], changed_files(cwd=self.root))
+        self.assertEqual([os.path.join('docs', 'b.md'), 'new.md'], changed_files('HEAD~1', cwd=self.root))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            changed_files('no-such-ref', cwd=self.root)
+
+        with self.assertRaises(ValueError):
+            changed_files('--output=x', cwd=self.root)
+
+    def test_cli(self):
+        self.write('a.md', '中文abc')
+        self.write('docs/b.md', '中文abc')
+        self.git('add', 'a.md')
+        env = dict(os.environ, PYTHONPATH=ROOT)
+
+        def run_cli(*args):
+            return subprocess.run([sys.executable, '-m', 'prettymd', '--no-cache'] + list(args), cwd=self.root,
+                                  env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                  universal_newlines=True)
+
+        process = run_cli('--staged', '--check')
+        self.assertEqual(1, process.returncode)
+        self.assertIn('would reformat a.md', process.stdout)
+
+        run_cli('--staged', '-j', '2')
+        self.assertEqual('中文 abc', self.read('a.md'))
+        self.assertEqual('中文abc', self.read('docs/b.md'))
+
+        run_cli('--changed-since', 'HEAD')
+        self.assertEqual('中文 abc', self.read('docs/b.md'))
+        self.assertEqual(0, run_cli('--changed-since', 'HEAD', '--check').returncode)
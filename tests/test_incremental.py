@@ -0,0 +1,81 @@
+from textwrap import dedent
+from unittest import TestCase
+from unittest.mock import patch
+
+from prettymd.formatter import Formatter, format
+from prettymd.incremental import IncrementalFormatter
+
+DOCUMENT = dedent("""\
+    ## 安装install
+    使用pip安装
+    ```shell
+    pip install prettymd
+    ```
+    ### 配置config
+    name | value
+    -----|------
+    style | code
+
+    > 引用quote
+
+    ## 使用usage
+    调用format函数
+    """)
+
+
+class TestIncrementalFormatter(TestCase):
+
+    def assert_updated(self, formatter, lines, changed_ranges=None):
+        text = '\n'.join(lines)
+        self.assertEqual(format(text, **formatter.options), formatter.update(text, changed_ranges))
+
+    def test_update_same_as_format(self):
+        for options in ({'style': 'code'}, {'newline_between_headers': True}, {'reindex_headers': False}):
+            formatter = IncrementalFormatter(**options)
+            lines = DOCUMENT.splitlines()
+            self.assertEqual(format(DOCUMENT, **formatter.options), formatter.format(DOCUMENT))
+
+            # 修改普通的行
+            lines[1] = '使用pip或conda安装'
+            self.assert_updated(formatter, lines, [(1, 2)])
+
+            # 打开代码块会影响之后所有的行
+            lines.insert(6, '```')
+            self.assert_updated(formatter, lines, [(6, 7)])
+            del lines[6]
+            self.assert_updated(formatter, lines)
+
+            # 代码块的语言决定是否替换提示符
+            lines.insert(3, 'In [1]: import prettymd')
+            self.assert_updated(formatter, lines, [(3, 4)])
+            lines[2] = '```python'
+            self.assert_updated(formatter, lines, [(2, 3)])
+            del lines[3]
+            lines[2] = '```shell'
+            self.assert_updated(formatter, lines)
+
+            # 改变最上层标题的级别
+            lines.insert(0, '# 标题title')
+            self.assert_updated(formatter, lines, [(0, 1)])
+
+            # 插入标题后之后的标题重新编号
+            lines.insert(10, '### 新的标题')
+            self.assert_updated(formatter, lines)
+
+            # 表格的开始取决于下一行
+            lines[8] = 'name | value'
+            lines.insert(9, '--|--')
+            self.assert_updated(formatter, lines, [(8, 10)])
+
+    def test_only_changed_lines_formatted(self):
+        lines = DOCUMENT.splitlines() * 50
+        formatter = IncrementalFormatter(style='code')
+        formatter.format('\n'.join(lines))
+
+        lines[99] = '修改了一行text'
+        text = '\n'.join(lines)
+        with patch.object(Formatter, 'process_line', autospec=True, side_effect=Formatter.process_line) as process_line:
+            new_text = formatter.update(text, [(99, 100)])
+
+        self.assertEqual(format(text, style='code'), new_text)
+        self.assertLess(process_line.call_count, 5)
@@ -0,0 +1,89 @@
+from textwrap import dedent
+from unittest import TestCase
+
+from prettymd.formatter import Formatter
+from prettymd.lexer import Block, lex_blocks
+
+
+class TestLexer(TestCase):
+
+    def assert_blocks(self, text, expect):
+        blocks = lex_blocks(text.splitlines())
+        self.assertEqual([Block(*block) for block in expect], blocks)
+
+    def test_blocks(self):
+        text = dedent("""
+        # 标题
+        中文english
+        第二行
+        > 引用quote
+
+        ```
+        In [1]: x
+
+        ```
+        a|b
+        -|-
+        1|2
+        结束
+        """).strip()
+        self.assert_blocks(text, [
+            ('header', 0, 1),
+            ('paragraph', 1, 3),
+            ('quote', 3, 4),
+            ('blank', 4, 5),
+            ('code', 5, 9),
+            ('table', 9, 12),
+            ('paragraph', 12, 13),
+        ])
+
+    def test_desc(self):
+        text = '---\ntitle: a\n\n# 不是标题\n---\n```\ncode\n```'
+        self.assert_blocks(text, [
+            ('split', 0, 1),
+            ('desc', 1, 2),
+            ('blank', 2, 3),
+            ('desc', 3, 5),
+            ('code', 5, 8),
+        ])
+
+    def test_split_and_table_header(self):
+        self.assert_blocks('中文\n---\n# a|b\n-|-\n# c', [
+            ('paragraph', 0, 1),
+            ('split', 1, 2),
+            ('table_header', 2, 3),
+            ('table', 3, 4),
+            ('header', 4, 5),
+        ])
+
+    def test_adjacent_code_blocks(self):
+        self.assert_blocks('```shell\nls\n```\n```python\nx\n```\n中文', [
+            ('code', 0, 3),
+            ('code', 3, 6),
+            ('paragraph', 6, 7),
+        ])
+
+    def test_empty(self):
+        self.assertEqual([], lex_blocks([]))
+        self.assert_blocks('\n', [('blank', 0, 1)])
+
+    def test_same_as_process_line(self):
+        text = dedent("""
+        # 标题a
+        中文english
+        > 引用quote
+
+        ```python
+        In [1]: x = 1
+           ...: y = 2
+        Out[1]: 1
+        ```
+        # a|b
+        -|-
+        ---
+        ## 子标题b
+        """).strip()
+
+        for kwargs in ({}, {'newline_between_headers': True}, {'py_prompt': 'ipython', 'style': 'code'}):
+            expect = Formatter(iter(text.splitlines()), **kwargs).format()
+            self.assertEqual(expect, Formatter(text, **kwargs).format())
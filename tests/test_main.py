@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestStdin(TestCase):
+
+    def run_cli(self, *args, **kwargs):
+        return subprocess.Popen([sys.executable, '-m', 'prettymd'] + list(args), cwd=ROOT,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                universal_newlines=True, encoding='utf-8', **kwargs)
+
+    def test_format_stdin(self):
+        for args in ((), ('-f', '-')):
+            process = self.run_cli('-s', 'code', *args)
+            stdout, _ = process.communicate('中文abc\n> 引用quote\n\n## 标题title\n')
+            self.assertEqual('中文 `abc`\n> 引用 `quote`\n\n\n## 标题 `title`\n', stdout)
+
+    def test_output_before_input_ends(self):
+        process = self.run_cli('-s', 'code')
+
+        try:
+            # 超过输出缓冲区大小的内容在输入结束前就会被写出
+            process.stdin.write('中文abc\n' + '第二行line\n' * 1000)
+            process.stdin.flush()
+            self.assertEqual('中文 `abc`\n', process.stdout.readline())
+        finally:
+            process.stdin.close()
+            process.stdout.read()
+            process.wait()
+
+    def test_stats_stdin(self):
+        for args in ((), ('--check',)):
+            process = self.run_cli('--stats', '-s', 'code', *args, stderr=subprocess.PIPE)
+            _, stderr = process.communicate('# 标题\n中文abc\n')
+
+            # 每行为名称和数值，耗时以 s 结尾
+            rows = dict(row.rsplit(None, 1) for row in stderr.splitlines())
+            self.assertEqual('1', rows['documents'])
+            self.assertGreater(float(rows['time total'][:-1]), 0)
+            self.assertGreaterEqual(float(rows['time total'][:-1]), float(rows['time line_engine'][:-1]))
+
+    def test_check_stdin(self):
+        process = self.run_cli('--check', '-f', '-')
+        stdout, _ = process.communicate('中文 abc\n')
+        self.assertEqual(0, process.returncode)
+        self.assertEqual('', stdout)
+
+        process = self.run_cli('--check')
+        stdout, _ = process.communicate('中文abc\n')
+        self.assertEqual(1, process.returncode)
+        self.assertEqual('would reformat <stdin>\n', stdout)
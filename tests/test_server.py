@@ -0,0 +1,124 @@
+import io
+import json
+import os
+import socket
+import sys
+import threading
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from prettymd.__main__ import main
+from prettymd.client import Client
+from prettymd.formatter import LINE_CACHE
+from prettymd.server import FormatService, make_server, serve_stdio
+
+
+class TestFormatService(TestCase):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.service = FormatService(style='code')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_format_content(self):
+        self.assertEqual({'id': 1, 'result': '中文 `abc`'}, self.service.handle({'id': 1, 'content': '中文abc'}))
+        response = self.service.handle({'id': 2, 'content': '中文abc', 'options': {'style': None, 'output': 'x'}})
+        self.assertEqual('中文 abc', response['result'])
+        self.assertEqual(2, len(self.service.formatters))
+
+    def test_format_path(self):
+        filepath = os.path.join(self.tmpdir.name, 'a.md')
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write('中文abc')
+
+        self.assertTrue(self.service.handle({'path': filepath})['changed'])
+        self.assertFalse(self.service.handle({'path': filepath})['changed'])
+        with open(filepath, encoding='utf-8') as f:
+            self.assertEqual('中文 `abc`', f.read())
+
+        # 文件末尾的换行符会被保留
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write('中文 `abc`\n')
+        self.assertFalse(self.service.handle({'path': filepath})['changed'])
+        with open(filepath, encoding='utf-8') as f:
+            self.assertEqual('中文 `abc`\n', f.read())
+
+    def test_errors(self):
+        self.assertIn('error', self.service.handle({'id': 1, 'content': 'a', 'options': {'engine': 'unknown'}}))
+        self.assertIn('error', json.loads(self.service.handle_line('not json')))
+
+    def test_serve_stdio(self):
+        stdin = io.StringIO('{"id": 1, "content": "中文abc"}\n\n{"id": 2, "content": "abc中文"}\n')
+        stdout = io.StringIO()
+        serve_stdio(self.service, stdin, stdout)
+
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([{'id': 1, 'result': '中文 `abc`'}, {'id': 2, 'result': '`abc` 中文'}], responses)
+
+    def test_serve_from_cli(self):
+        LINE_CACHE.clear()
+        stdin = io.StringIO('{"id": 1, "content": "中文abc"}\n{"id": 2, "content": "中文abc"}\n')
+        stdout = io.StringIO()
+
+        with patch.object(sys, 'argv', ['prettymd', '--serve', '--socket', '-', '-s', 'code']), \
+                patch.object(sys, 'stdin', stdin), patch.object(sys, 'stdout', stdout):
+            main()
+
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(['中文 `abc`', '中文 `abc`'], [response['result'] for response in responses])
+        # 命令行启动的服务同样启用行缓存
+        self.assertEqual(1, LINE_CACHE.hits)
+        LINE_CACHE.clear()
+
+
+@skipUnless(hasattr(socket, 'AF_UNIX'), 'unix socket is not supported')
+class TestClient(TestCase):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmpdir.name, 'prettymd.sock')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_format_through_server(self):
+        server = make_server(self.socket_path, FormatService())
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        try:
+            with Client(self.socket_path) as client:
+                self.assertIsNotNone(client.sock)
+                self.assertEqual('中文 `abc`', client.format('中文abc', style='code'))
+                self.assertEqual('中文 abc', client.format('中文abc'))
+
+                with self.assertRaises(ValueError):
+                    client.format('a', py_prompt='unknown')
+
+            with self.assertRaises(ValueError):
+                make_server(self.socket_path, FormatService())
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        # 残留的 socket 文件不影响重新启动
+        make_server(self.socket_path, FormatService()).server_close()
+
+    def test_fallback_without_server(self):
+        with Client(self.socket_path) as client:
+            self.assertIsNone(client.sock)
+            self.assertEqual('中文 `abc`', client.format('中文abc', style='code'))
+
+            filepath = os.path.join(self.tmpdir.name, 'a.md')
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write('中文abc')
+            self.assertTrue(client.format_path(filepath))
+            self.assertFalse(client.format_path(filepath))
+
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write('中文 abc\n')
+            self.assertFalse(client.format_path(filepath))
@@ -0,0 +1,48 @@
+from textwrap import dedent
+from unittest import TestCase
+
+from prettymd.formatter import RunLineFormatter
+from prettymd.shadow import Divergence, shadow_document, shadow_fuzz
+
+
+class BrokenLineFormatter(RunLineFormatter):
+
+    def format(self):
+        if 'broken' in self.line:
+            return self.line
+        return super().format()
+
+
+class TestShadow(TestCase):
+
+    text = dedent("""
+    # 标题title
+    中文english
+    ```
+    code 中文broken
+    ```
+    > 引用quote broken
+    """).strip()
+
+    def test_same_output(self):
+        for style in (None, 'code'):
+            report = shadow_document(self.text, 'run', style=style)
+            self.assertEqual([], report.divergences)
+            self.assertEqual(3, report.lines)
+            self.assertGreater(report.reference_time, 0)
+
+            report = shadow_fuzz(2000, 'run', style=style)
+            self.assertEqual([], report.divergences)
+            self.assertEqual(2000, report.lines)
+
+    def test_divergences(self):
+        report = shadow_document(self.text, BrokenLineFormatter, source='a.md')
+        self.assertEqual(
+            [Divergence('a.md', 6, '> 引用quote broken', '> 引用 quote broken', '> 引用quote broken')],
+            report.divergences,
+        )
+        self.assertIn('a.md:6:', report.report())
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            shadow_document(self.text, 'unknown')
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from prettymd.formatter import CompiledFormatter
+from prettymd.watch import InotifyWatcher, PollingWatcher, format_changed, iter_changes, load_libc
+
+
+class TestPollingWatcher(TestCase):
+
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self.root = self.tmpdir.name
+        self.write('a.md', '中文 abc')
+        self.watcher = self.make_watcher()
+
+    def tearDown(self):
+        self.watcher.close()
+        self.tmpdir.cleanup()
+
+    def make_watcher(self):
+        return PollingWatcher(self.root, interval=0.02)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def write(self, name, content):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(self.path(name), encoding='utf-8') as f:
+            return f.read()
+
+    def test_read(self):
+        self.assertEqual(set(), self.watcher.read(0.1))
+
+        self.write('a.md', '中文abc')
+        self.write('b.txt', '中文abc')
+        self.write('sub/c.md', '中文abc')
+        time.sleep(0.05)
+        self.assertEqual({self.path('a.md'), self.path('sub/c.md')}, self.read_changes())
+
+    def test_no_self_trigger(self):
+        formatter = CompiledFormatter(style='code')
+        known = {}
+
+        self.write('a.md', '中文abc')
+        paths = sorted(self.read_changes())
+        self.assertEqual([self.path('a.md')], format_changed(formatter, paths, known))
+        self.assertEqual('中文 `abc`', self.read('a.md'))
+
+        # 写回格式化的结果也会产生通知，但不会再次写入
+        paths = sorted(self.read_changes())
+        self.assertEqual([self.path('a.md')], paths)
+        self.assertEqual([], format_changed(formatter, paths, known))
+
+        # 编辑器保存时在末尾加上的换行符会被保留
+        self.write('a.md', '中文abc\n')
+        paths = sorted(self.read_changes())
+        self.assertEqual([self.path('a.md')], format_changed(formatter, paths, known))
+        self.assertEqual('中文 `abc`\n', self.read('a.md'))
+        self.assertEqual([], format_changed(formatter, sorted(self.read_changes()), known))
+
+        os.remove(self.path('a.md'))
+        self.assertEqual([], format_changed(formatter, paths, known))
+        self.assertEqual({}, known)
+
+    def test_debounce(self):
+        def save():
+            for index in range(5):
+                self.write('a.md', '中文abc%s' % index)
+                time.sleep(0.02)
+
+        thread = threading.Thread(target=save)
+        thread.start()
+        paths = next(iter_changes(self.watcher, debounce=0.3))
+        thread.join()
+
+        self.assertEqual([self.path('a.md')], paths)
+        self.assertEqual(set(), self.watcher.read(0.1))
+
+    def read_changes(self):
+        changed = set()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            changed |= self.watcher.read(0.1)
+            if changed and not self.watcher.read(0.1):
+                break
+        return changed
+
+
+class TestInotifyWatcher(TestPollingWatcher):
+
+    def setUp(self):
+        if load_libc() is None:
+            self.skipTest('inotify is not available')
+        super().setUp()
+
+    def make_watcher(self):
+        return InotifyWatcher(self.root)